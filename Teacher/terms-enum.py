@@ -2,9 +2,14 @@ import math
 import sys
 
 # to be able to specify type annotations and static type checker mypy
-from typing import List, Any, Set, Dict, Tuple, Optional
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
 # importation of abc module for abstract base classes
 from abc import ABCMeta, abstractmethod
+# registry of the operators, shared by both flavours of terms
+try:
+    from terms_ops import BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT, symbol
+except ImportError:  # imported from the package Teacher
+    from .terms_ops import BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT, symbol
 # for enum support
 from enum import Enum, unique
 
@@ -50,12 +55,23 @@ class Bin_op(Enum):
     SUB = 2
     MUL = 3
     DIV = 4
+    POW = 5
+    MOD = 6
+    MIN = 7
+    MAX = 8
     
     
 @unique
 class Una_op(Enum):
     """Enumeration of all supported unary operators"""
     NEG = 1
+
+
+@unique
+class Fun_op(Enum):
+    """Enumeration of all supported functions"""
+    SQRT = 1
+    EXP = 2
     
 class Term(metaclass=ABCMeta):
     """
@@ -70,6 +86,38 @@ class Term(metaclass=ABCMeta):
         :return: the value of the evaluated term
         """
         pass               # no implementation
+
+    def compile(self) -> Callable[[Context], float]:
+        """
+        Translates the term into a single Python function (see terms_compile).
+        The function returns the same value as eval for any context.
+        :return: function taking a context and returning the value of the term
+        """
+        try:  # the code generator is only needed when compiling
+            from terms_compile import compile_term
+        except ImportError:  # imported from the package Teacher
+            from .terms_compile import compile_term
+        return compile_term(self)
+
+    def eval_batch(self, bindings: Any) -> Any:
+        """
+        Evaluates the term for many rows at once with NumPy (see terms_batch).
+        :param bindings: dictionary (name, array) or a context whose values are arrays
+        :return: NumPy array with one value per row
+        """
+        try:  # NumPy is only needed for batches
+            from terms_batch import eval_batch
+        except ImportError:  # imported from the package Teacher
+            from .terms_batch import eval_batch
+        return eval_batch(self, bindings)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        The operation bound at construction is not pickled, thus the registered
+        operations need not be picklable (lambdas). It is looked up again by __setstate__.
+        :return: the attributes of the term without 'operation'
+        """
+        return {name: value for name, value in self.__dict__.items() if name != "operation"}
            
 class Constant(Term):
     """
@@ -116,6 +164,7 @@ class Binary_expression(Term):
     """
     def __init__(self, left: Term, right: Term, bin_op: Bin_op) -> None:
         """
+        The operation of the operator is looked up once in the registry (terms_ops).
         :param left: left term
         :param right: right term
         :param bin_op: binary operator (enum)
@@ -123,6 +172,12 @@ class Binary_expression(Term):
         self.left = left
         self.right = right
         self.bin_op = bin_op
+        self.operation = BIN_OP_DICT[symbol(bin_op)]
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        "Restores an unpickled term and binds its operation again"
+        self.__dict__.update(state)
+        self.operation = BIN_OP_DICT[symbol(self.bin_op)]
 
     def eval(self, context: Context) -> float:
         """
@@ -131,14 +186,7 @@ class Binary_expression(Term):
         """
         value_left  = self.left.eval(context)
         value_right = self.right.eval(context)
-        bin_op_dict = {Bin_op.ADD: lambda l, r : l + r,
-                       Bin_op.SUB: lambda l, r : l - r,
-                       Bin_op.MUL: lambda l, r : l * r,
-                       Bin_op.DIV: lambda l, r : l / r
-        }
-
-        operation = bin_op_dict[self.bin_op]
-        return operation(value_left, value_right)
+        return self.operation(value_left, value_right)
 
     
 class Unary_expression(Term):
@@ -148,20 +196,55 @@ class Unary_expression(Term):
     def __init__(self, term: Term, una_op: Una_op) -> None:
         """
         :param term: single term
-        :param una_op: binary operator (enum)
+        :param una_op: unary operator (enum)
         """
         self.term = term
         self.una_op = una_op
+        self.operation = UNA_OP_DICT[symbol(una_op)]
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        "Restores an unpickled term and binds its operation again"
+        self.__dict__.update(state)
+        self.operation = UNA_OP_DICT[symbol(self.una_op)]
 
     def eval(self, context: Context) -> float:
         """
-        Evaluates both the terms first and then apply the binary_operator
-        :return: the evaluated value of the binary expression
+        Evaluates the term first and then apply the unary operator
+        :return: the evaluated value of the unary expression
         """
         value_term  = self.term.eval(context)
-        una_op_dict = {Una_op.NEG: lambda t : (-1) * t }
-        operation = una_op_dict[self.una_op]
-        return operation(value_term)
+        return self.operation(value_term)
+
+
+class Function_expression(Term):
+    """
+    A function expression applies a function (sqrt, exp, ...) to n terms.
+    """
+    def __init__(self, terms: List[Term], function: Fun_op) -> None:
+        """
+        :param terms: the arguments of the function
+        :param function: function (enum)
+        """
+        self.terms = terms
+        self.function = function
+        self.operation, arity = FUNCTION_DICT[symbol(function)]
+        if len(terms) != arity:
+            print("The function '" + symbol(function) + "' expects " + str(arity) + " terms")
+            sys.exit()
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        "Restores an unpickled term and binds its function again"
+        self.__dict__.update(state)
+        self.operation = FUNCTION_DICT[symbol(self.function)][0]
+
+    def eval(self, context: Context) -> float:
+        """
+        Evaluates all the terms first and then apply the function
+        :return: the evaluated value of the function expression
+        """
+        if len(self.terms) == 1:  # sqrt, exp, ...: no list of values
+            return self.operation(self.terms[0].eval(context))
+        return self.operation(*[term.eval(context) for term in self.terms])
 
     
 def main() -> None:
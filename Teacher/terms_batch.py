@@ -0,0 +1,155 @@
+"""
+Batch evaluation of a term over columns of values with NumPy.
+
+Instead of one scalar per variable, each variable is bound to a NumPy array
+(a column) and the term is evaluated element-wise: a single walk of the tree
+evaluates the term for all the rows at once. Example for (3 + -d) * 5:
+
+    term.eval_batch({"d": numpy.arange(1000000)})
+
+The division follows IEEE 754 instead of raising ZeroDivisionError:
+x / 0 gives inf or -inf and 0 / 0 gives nan, row by row. In the same way
+sqrt(-1), x % 0 and (-8) ** 0.5 give nan. The operators registered in terms_ops
+without a NumPy equivalent are applied row by row with numpy.vectorize.
+"""
+
+import sys
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+import numpy as np
+try:
+    from terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+    from terms_bench import load_flavours, operators, random_term, best_time
+except ImportError:  # imported from the package Teacher
+    from .terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+    from .terms_bench import load_flavours, operators, random_term, best_time
+
+BIN_OP_UFUNC: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {"+": np.add,
+                                                                           "-": np.subtract,
+                                                                           "*": np.multiply,
+                                                                           "/": np.true_divide,
+                                                                           "**": np.power,
+                                                                           "%": np.mod,
+                                                                           "min": np.minimum,
+                                                                           "max": np.maximum
+                                                                           }
+
+UNA_OP_UFUNC: Dict[str, Callable[[np.ndarray], np.ndarray]] = {"-": np.negative}
+
+FUNCTION_UFUNC: Dict[str, Callable[..., np.ndarray]] = {"sqrt": np.sqrt,
+                                                        "exp": np.exp
+                                                        }
+
+
+def apply(ufuncs: Dict[str, Callable[..., np.ndarray]], name: str, operation: Callable[..., Any],
+          values: List[np.ndarray]) -> np.ndarray:
+    """
+    Applies an operator element-wise.
+    :param ufuncs: NumPy functions of the operators
+    :param name: symbol of the operator
+    :param operation: the operation of the registry, used if there is no NumPy function
+    :param values: the values of the operands
+    :return: the values of the operator
+    """
+    if name in ufuncs:
+        return ufuncs[name](*values)
+    return np.vectorize(operation, otypes=[np.float64])(*values)
+
+
+def columns_of(bindings: Any) -> Dict[str, np.ndarray]:
+    """
+    Converts the bindings into float columns of the same length, a scalar is
+    repeated for every row.
+    :param bindings: dictionary (name, values) or a context whose values are arrays or scalars
+    :return: dictionary (name, float64 array)
+    """
+    table = bindings.lookup_table if hasattr(bindings, "lookup_table") else bindings
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in table.items()}
+    lengths = {column.shape for column in columns.values() if column.ndim > 0}
+    if len(lengths) > 1:
+        print("The columns have different lengths:", sorted(lengths))
+        sys.exit()
+    if lengths:
+        rows = lengths.pop()
+        columns = {name: np.broadcast_to(column, rows) if column.ndim == 0 else column
+                   for name, column in columns.items()}
+    return columns
+
+
+def evaluate(term: Any, columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Evaluates a term element-wise, the constants are broadcast.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param columns: dictionary (name, float64 array)
+    :return: the values of the term, a scalar if the term has no variable
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return np.float64(term.value)
+    if node_kind == Kind.VARIABLE:
+        if term.name in columns:
+            return columns[term.name]
+        print("The variable '" + term.name + "' is not bound to a column")
+        sys.exit()
+    if node_kind == Kind.UNARY:
+        una_op = symbol(term.una_op)
+        return apply(UNA_OP_UFUNC, una_op, UNA_OP_DICT[una_op], [evaluate(term.term, columns)])
+    if node_kind == Kind.FUNCTION:
+        function = symbol(term.function)
+        values = [evaluate(operand, columns) for operand in term.terms]
+        return apply(FUNCTION_UFUNC, function, FUNCTION_DICT[function][0], values)
+    bin_op = symbol(term.bin_op)
+    value_left = evaluate(term.left, columns)
+    value_right = evaluate(term.right, columns)
+    return apply(BIN_OP_UFUNC, bin_op, BIN_OP_DICT[bin_op], [value_left, value_right])
+
+
+def eval_batch(term: Any, bindings: Any) -> np.ndarray:
+    """
+    Evaluates a term for every row of the bindings.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param bindings: dictionary (name, values) or a context whose values are arrays
+    :return: float64 array with one value per row
+    """
+    columns = columns_of(bindings)
+    rows = next(iter(columns.values())).shape if columns else ()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = evaluate(term, columns)
+    return np.broadcast_to(values, rows).copy()
+
+
+def main() -> None:
+    """ Launcher: benchmark of eval row by row against eval_batch """
+    rows = 100000
+    rng = np.random.default_rng(0)
+    for module in load_flavours():
+        print("Module", module.__name__)
+        bin_ops, neg = operators(module)
+        div = module.Bin_op.DIV if hasattr(module, "Bin_op") else "/"
+        ctx = module.Context()
+        ctx.bind("d", rng.uniform(-10, 10, rows))
+        term = random_term(module, 10, ["d"], random.Random(1))
+        values = term.eval_batch(ctx)
+        ctx_row = module.Context()
+
+        def row_by_row() -> List[float]:
+            results = []
+            for d in ctx.lookup_table["d"]:
+                ctx_row.bind("d", float(d))
+                results.append(term.eval(ctx_row))
+            return results
+
+        assert np.array_equal(row_by_row(), values)
+        t_eval = best_time(row_by_row, repeat=1)
+        t_batch = best_time(lambda: term.eval_batch(ctx))
+        print("%d rows: eval %.3f s, eval_batch %.4f s, speedup %.0fx" % (rows, t_eval, t_batch, t_eval / t_batch))
+        # 1 / (3 + -d): division by zero for d = 3
+        addition = module.Binary_expression(module.Constant(3), module.Unary_expression(module.Variable("d"), neg), bin_ops[0])
+        division = module.Binary_expression(module.Constant(1), addition, div)
+        print("1 / (3 + -d) for d = [1, 3, 4]:", division.eval_batch({"d": [1, 3, 4]}))
+
+
+if __name__ == "__main__":
+    main()
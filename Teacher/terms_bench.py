@@ -0,0 +1,103 @@
+"""
+Helpers for the benchmarks of the modules working on terms:
+generation of random terms of a given depth and measurement of running times.
+The terms are built with the classes of a given module ('terms' or 'terms-enum').
+"""
+
+import importlib
+import random
+import time
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+
+
+def load_flavours() -> List[ModuleType]:
+    """
+    Imports both flavours of the terms. The name 'terms-enum' contains a dash,
+    thus it cannot be imported with an import statement.
+    :return: the modules 'terms' and 'terms-enum'
+    """
+    return [importlib.import_module("terms"), importlib.import_module("terms-enum")]
+
+
+def operators(module: ModuleType) -> Tuple[List[Any], Any]:
+    """
+    Gives the binary operators +, -, * and the unary operator - of a flavour.
+    The division is not used to avoid the division by zero in random terms.
+    :param module: 'terms' or 'terms-enum'
+    :return: tuple (list of binary operators, unary operator)
+    """
+    if hasattr(module, "Bin_op"):
+        return [module.Bin_op.ADD, module.Bin_op.SUB, module.Bin_op.MUL], module.Una_op.NEG
+    return ["+", "-", "*"], "-"
+
+
+def random_leaf(module: ModuleType, variables: List[str], rng: random.Random) -> Any:
+    """
+    :return: a constant between 1 and 9 or one of the variables
+    """
+    if variables and rng.random() < 0.5:
+        return module.Variable(rng.choice(variables))
+    return module.Constant(rng.randint(1, 9))
+
+
+def random_term(module: ModuleType, depth: int, variables: List[str],
+                rng: Optional[random.Random] = None) -> Any:
+    """
+    Builds a random term of exactly the given depth. At each level one child
+    continues to the full depth and the other one is a small subterm (depth <= 2),
+    thus the number of nodes grows linearly with the depth.
+    :param module: 'terms' or 'terms-enum'
+    :param depth: depth of the term, a leaf has depth 0
+    :param variables: names of the variables that can appear in the term
+    :param rng: random generator, a seeded one is created if not given
+    :return: the root of the term
+    """
+    rng = rng or random.Random(42)
+    bin_ops, neg = operators(module)
+    term = random_leaf(module, variables, rng)
+    for level in range(depth):
+        if rng.random() < 0.15:
+            term = module.Unary_expression(term, neg)
+            continue
+        other = random_leaf(module, variables, rng)
+        if rng.random() < 0.5:
+            other = module.Binary_expression(other, random_leaf(module, variables, rng),
+                                             rng.choice(bin_ops))
+        if rng.random() < 0.5:
+            term = module.Binary_expression(term, other, rng.choice(bin_ops))
+        else:
+            term = module.Binary_expression(other, term, rng.choice(bin_ops))
+    return term
+
+
+def count_nodes(term: Any) -> int:
+    """
+    :return: the number of nodes of a term (shared nodes are counted each time)
+    """
+    if hasattr(term, "bin_op"):
+        return 1 + count_nodes(term.left) + count_nodes(term.right)
+    if hasattr(term, "una_op"):
+        return 1 + count_nodes(term.term)
+    if hasattr(term, "function"):
+        return 1 + sum(count_nodes(operand) for operand in term.terms)
+    return 1
+
+
+def best_time(function: Callable[[], Any], repeat: int = 5, number: int = 1) -> float:
+    """
+    Measures a function several times and keeps the best measure.
+    :param function: function without parameters to measure
+    :param repeat: number of measures
+    :param number: number of calls per measure
+    :return: the best time of a single call in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
@@ -0,0 +1,192 @@
+"""
+Parallel parsing of files of expressions, one expression per line.
+
+Parsing tens of millions of lines in one process uses one core. 'bulk_parse'
+splits the file into ranges of bytes ending at the end of a line, and a pool of
+processes parses the ranges:
+  - each process reads its range only, the lines are parsed with a parser of
+    terms_parsing (Iterative_table_parser by default, which has no limit of depth);
+  - the terms of a range are written in the compact format of terms_store into
+    a part file, nothing is pickled per term;
+  - the lines which cannot be parsed are reported with their line number (from 1)
+    and the message of the ParsingException, they have no term in the parts. With
+    a recursive parser, a line nested too deeply is reported as an error too.
+
+    report = bulk_parse("expressions.txt", "out/expressions", workers=4)
+    report.parts                   # the files of terms_store, in the order of the lines
+    report.errors                  # [(line number, message), ...]
+    Corpus_file(report.parts[0]).eval(0, ctx)
+
+The ranges are smaller than the file divided by the number of processes
+(range_bytes), thus the memory of a process is bounded and a slow range does not
+delay the others.
+"""
+
+import os
+import time
+import random
+import tempfile
+import importlib
+import multiprocessing
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_parsing import ParsingException, Parser, Table_parser, Iterative_table_parser, parse_expression, \
+    random_expression
+from terms_store import write_corpus, Corpus_file
+from terms_bench import load_flavours, best_time
+
+RANGE_BYTES = 1 << 22  # size of the ranges of the file parsed by a process
+
+
+class Bulk_report:
+    """
+    Result of a bulk parse: the part files, the errors and the throughput.
+    """
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.lines = 0
+        self.terms = 0
+        self.errors: List[Tuple[int, str]] = []
+        self.seconds = 0.0
+
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return "%d lines, %d terms in %d parts, %d errors, %.2f s, %.0f lines per second" % (
+            self.lines, self.terms, len(self.parts), len(self.errors), self.seconds, self.lines_per_second())
+
+
+def line_ranges(path: str, range_bytes: int = RANGE_BYTES) -> List[Tuple[int, int]]:
+    """
+    Splits a file into ranges of about 'range_bytes' bytes, each one ends after a newline
+    (or at the end of the file).
+    :return: the list of (start, end) offsets
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, "rb") as file:
+        while start < size:
+            file.seek(min(start + range_bytes, size))
+            file.readline()  # moves to the end of the line
+            end = min(file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(task: Tuple[str, int, int, str, str, type]) -> Tuple[str, int, int, List[Tuple[int, str]]]:
+    """
+    Parses the lines of a range of a file and writes their terms into a part file.
+    :param task: (path of the file, start, end, path of the part, name of the module, parser class)
+    :return: (path of the part, number of lines, number of terms, errors (line in the range from 0, message))
+    """
+    path, start, end, part, module_name, parser_class = task
+    module = importlib.import_module(module_name)
+    with open(path, "rb") as file:
+        file.seek(start)
+        lines = file.read(end - start).split(b"\n")  # splitlines also splits on \x85, \x0c, a lone \r, ...
+    if lines[-1] == b"":
+        lines.pop()  # after the last newline
+    lines = [line[:-1] if line.endswith(b"\r") else line for line in lines]
+    terms = []
+    errors = []
+    for number, line in enumerate(lines):
+        try:
+            terms.append(parse_expression(line.decode("latin-1"), module, parser_class))
+        except ParsingException as error:
+            errors.append((number, error.message))
+        except RecursionError:  # recursive parser
+            errors.append((number, "Expression nested too deeply for " + parser_class.__name__))
+    write_corpus(terms, part)
+    return part, len(lines), len(terms), errors
+
+
+def bulk_parse(path: str, output: str, workers: int = 0, module_name: str = "terms",
+               parser_class: type = Iterative_table_parser, range_bytes: int = RANGE_BYTES) -> Bulk_report:
+    """
+    Parses a file of expressions, one per line, with a pool of processes.
+    :param path: the file of expressions
+    :param output: prefix of the part files, the parts are named output.00000.terms, ...
+    :param workers: number of processes, all the cores if 0
+    :param module_name: 'terms' or 'terms-enum', the classes of the built terms
+    :param parser_class: a parser of terms_parsing, e.g. Parser, Table_parser or Iterative_table_parser
+    :param range_bytes: size of the ranges of the file parsed by a process
+    :return: the part files in the order of the lines, the errors and the throughput
+    """
+    report = Bulk_report()
+    start = time.perf_counter()
+    tasks = [(path, range_start, range_end, "%s.%05d.terms" % (output, i), module_name, parser_class)
+             for i, (range_start, range_end) in enumerate(line_ranges(path, range_bytes))]
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for part, lines, terms, errors in pool.imap(parse_range, tasks):
+            report.parts.append(part)
+            report.errors.extend((report.lines + number + 1, message) for number, message in errors)
+            report.lines += lines
+            report.terms += terms
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def write_expressions(path: str, lines: int, rng: random.Random) -> None:
+    """
+    Writes a file of random expressions, one per line, some of them are wrong.
+    """
+    with open(path, "w") as file:
+        for number in range(lines):
+            expr = random_expression(5, rng)
+            if number % 5000 == 4999:
+                expr = expr + ")"
+            file.write(expr + "\n")
+
+
+def main() -> None:
+    """ Launcher: lines per second of bulk_parse against the number of processes """
+    module = load_flavours()[0]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "expressions.txt")
+        lines = 40000
+        write_expressions(path, lines, random.Random(11))
+        print("%d lines, %.1f MB" % (lines, os.path.getsize(path) / 1e6))
+
+        def serial() -> List[Any]:
+            terms = []
+            with open(path) as file:
+                for line in file:
+                    try:
+                        terms.append(parse_expression(line.rstrip("\n"), module, Parser))
+                    except ParsingException:
+                        pass
+            write_corpus(terms, os.path.join(directory, "serial.terms"))
+            return terms
+
+        terms = serial()
+        t_serial = best_time(serial, repeat=1)
+        print("serial Parser: %.0f lines per second" % (lines / t_serial))
+        for workers in sorted({1, 2, os.cpu_count() or 1}):
+            for parser_class in [Parser, Table_parser, Iterative_table_parser]:
+                report = bulk_parse(path, os.path.join(directory, "bulk"), workers, parser_class=parser_class,
+                                    range_bytes=1 << 18)
+                print("%2d processes, %22s: %s (%.1fx)" % (workers, parser_class.__name__, report,
+                                                           t_serial / report.seconds))
+        print("errors:", report.errors[:2], "...")
+        ctx = module.Context()
+        values = []
+        for part in report.parts:
+            corpus = Corpus_file(part)
+            values.extend(corpus.eval(index, ctx) for index in range(len(corpus)))
+            corpus.close()
+        assert len(values) == len(terms) == lines - len(report.errors)
+        assert all(value == term.eval(ctx) for value, term in zip(values[:10000], terms))
+        with open(path, "w") as file:  # a line nested 5000 levels deep
+            file.write("(1+2)\n" + "(" * 5000 + "1" + "+1)" * 5000 + "\n(3*4)\n")
+        for parser_class in [Table_parser, Iterative_table_parser]:
+            report = bulk_parse(path, os.path.join(directory, "deep"), 1, parser_class=parser_class)
+            print("deep line, %22s: %d terms, errors %s" % (parser_class.__name__, report.terms, report.errors))
+
+
+if __name__ == "__main__":
+    main()
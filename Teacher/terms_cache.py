@@ -0,0 +1,190 @@
+"""
+Cache of parsed expressions: the same source text is parsed only once.
+
+The cache maps the normalized text of an expression to its term and to the
+compiled function of the term (see terms_compile). The text is normalized by
+removing the whitespace, thus "(3 + 5)" and "(3+5)" share the same entry. At
+most 'capacity' expressions are kept, the least recently used one is evicted
+first (LRU):
+
+    cache = Expression_cache(terms, capacity=1000)
+    entry = cache.get("((3+5)*2)")
+    entry.term.eval(ctx)
+    entry.compiled(ctx)                 # compiled at the first use
+    cache.hits, cache.misses, cache.evictions
+
+An expression raising a ParsingException is not cached. 'Locked_expression_cache'
+can be shared by several threads.
+"""
+
+import random
+import threading
+from collections import OrderedDict
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_parsing import parse_expression, random_expression
+from terms_bench import load_flavours, best_time
+
+
+def normalize(expr: str) -> str:
+    """
+    :return: the expression without whitespace, the key of the cache
+    """
+    return "".join(expr.split())
+
+
+class Cache_entry:
+    """
+    Parsed expression: its term and the compiled function of the term. The term
+    is compiled the first time the function is asked for, an expression seen only
+    once is not compiled.
+    """
+
+    def __init__(self, term: Any) -> None:
+        self.term = term
+        self.function: Optional[Callable[[Any], float]] = None
+
+    @property
+    def compiled(self) -> Callable[[Any], float]:
+        """
+        :return: the compiled function of the term, or its method eval if the term cannot be compiled
+        """
+        if self.function is None:
+            self.function = self.term.compile() if hasattr(self.term, "compile") else self.term.eval
+        return self.function
+
+
+class Expression_cache:
+    """
+    Bounded LRU cache of the parsed expressions of a flavour of the terms.
+    """
+
+    def __init__(self, module: ModuleType, capacity: int = 1024) -> None:
+        """
+        :param module: 'terms' or 'terms-enum', the classes of the parsed terms
+        :param capacity: maximal number of expressions in the cache
+        """
+        if capacity < 1:
+            raise ValueError("the capacity of the cache must be at least 1")
+        self.module = module
+        self.capacity = capacity
+        self.entries: "OrderedDict[str, Cache_entry]" = OrderedDict()  # the last one is the most recent
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, expr: str) -> Cache_entry:
+        """
+        Gives the parsed expression, parses it if it is not in the cache.
+        :param expr: the expression, see terms_parsing for the grammar
+        :return: the entry of the expression
+        """
+        key = normalize(expr)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = Cache_entry(parse_expression(key, self.module))
+        self.entries[key] = entry
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def hit_rate(self) -> float:
+        """
+        :return: the fraction of the calls of get found in the cache
+        """
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def clear(self) -> None:
+        """
+        Removes all the expressions, the statistics are kept.
+        """
+        self.entries.clear()
+
+
+class Locked_expression_cache(Expression_cache):
+    """
+    Expression cache protected by a lock. The expressions are parsed outside the
+    lock, thus two threads missing the same expression may both parse it.
+    """
+
+    def __init__(self, module: ModuleType, capacity: int = 1024) -> None:
+        super().__init__(module, capacity)
+        self.lock = threading.Lock()
+
+    def get(self, expr: str) -> Cache_entry:
+        key = normalize(expr)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            self.misses += 1
+        entry = Cache_entry(parse_expression(key, self.module))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+def zipf_workload(corpus: List[str], requests: int, exponent: float, rng: random.Random) -> List[str]:
+    """
+    :return: expressions drawn from the corpus, the k-th one with a probability proportional to 1 / k^exponent
+    """
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(corpus))]
+    return rng.choices(corpus, weights, k=requests)
+
+
+def main() -> None:
+    """ Launcher: throughput of parsing each request against the cache on a Zipf workload """
+    module = load_flavours()[0]
+    ctx = module.Context()
+    corpus = [random_expression(6, random.Random(i)) for i in range(10000)]
+    workload = zipf_workload(corpus, 20000, 1.1, random.Random(0))
+    t_parse = best_time(lambda: [parse_expression(expr, module).eval(ctx) for expr in workload], repeat=1)
+    print("parse and eval every request: %.0f requests per second" % (len(workload) / t_parse))
+    print("capacity  hit rate  evictions  requests per second  cache")
+    for capacity in [100, 1000, 10000]:
+        for cache_class in [Expression_cache, Locked_expression_cache]:
+            cache = cache_class(module, capacity)
+            t_cache = best_time(lambda: [cache.get(expr).term.eval(ctx) for expr in workload], repeat=1)
+            print("%8d  %8.3f  %9d  %19.0f  %s" % (capacity, cache.hit_rate(), cache.evictions,
+                                                   len(workload) / t_cache, cache_class.__name__))
+    hot = Expression_cache(module, 100)
+    for expr in workload:
+        hot.get(expr)
+    top = sorted(set(workload[:1000]), key=workload.count, reverse=True)[:10]
+    t_eval = best_time(lambda: [hot.get(expr).term.eval(ctx) for expr in top], number=100)
+    t_compiled = best_time(lambda: [hot.get(expr).compiled(ctx) for expr in top], number=100)
+    print("10 hottest expressions: %.1f us with eval, %.1f us compiled" % (t_eval * 1e6, t_compiled * 1e6))
+    cache = Locked_expression_cache(module, 1000)
+    threads = [threading.Thread(target=lambda part: [cache.get(expr) for expr in part], args=(workload[i::4],))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.hits + cache.misses == len(workload) and len(cache) <= 1000
+    print("4 threads: %d hits, %d misses, %d evictions" % (cache.hits, cache.misses, cache.evictions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Compilation of a term (expression) into a single Python function.
+
+The method 'eval' walks the tree at each evaluation: one recursive call per node
+and one dictionary lookup per operator. For an expression evaluated many times
+with different contexts, the tree can be translated once into Python source code,
+which is compiled with the predefined function 'compile'. Example for (3 + -d) * 5:
+
+    def compiled(context):
+        v0 = context.get_value('d')
+        t0 = (-1) * v0
+        t1 = c0 + t0
+        t2 = t1 * c1
+        return t2
+
+Each variable is looked up once per evaluation, the constants are stored in the
+closure of the function (c0 = 3, c1 = 5) and the operations are the same as
+in 'eval', thus the results are identical. The operators without an inline
+code (min, max, the functions sqrt, exp, ... of the registry of terms_ops) are
+called through the closure too: t3 = c2(t1, t2) with c2 = min.
+"""
+
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+try:
+    from terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+    from terms_bench import load_flavours, random_term, count_nodes, best_time
+except ImportError:  # imported from the package Teacher
+    from .terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+    from .terms_bench import load_flavours, random_term, count_nodes, best_time
+
+# prefix of the code of a unary operator, the same operation as in 'eval'
+UNA_OP_CODE: Dict[str, str] = {"-": "(-1) * "}
+
+# binary operators written inline as 'left symbol right'
+INLINE_BIN_OPS: Set[str] = {"+", "-", "*", "/", "**", "%"}
+
+
+class Code_generator:
+    """
+    Translates a term into the lines of the body of the compiled function.
+    Every node stores its value into a temporary local variable t0, t1, ...,
+    thus the generated code is never deeply nested.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.constants: List[Any] = []  # values of c0, c1, ...
+        self.variables: Dict[str, str] = {}  # name of variable -> local v0, v1, ...
+        self.temporaries = 0
+
+    def new_temporary(self, code: str) -> str:
+        """
+        Adds the line 'tN = code' to the body.
+        :return: the name of the temporary
+        """
+        name = "t" + str(self.temporaries)
+        self.temporaries += 1
+        self.lines.append(name + " = " + code)
+        return name
+
+    def new_constant(self, value: Any) -> str:
+        """
+        Adds a value to the closure of the compiled function.
+        :return: the name of the constant
+        """
+        self.constants.append(value)
+        return "c" + str(len(self.constants) - 1)
+
+    def emit(self, term: Any) -> str:
+        """
+        Generates the code for a term.
+        :param term: the term to translate
+        :return: the local name (constant, variable or temporary) holding the value
+        """
+        node_kind = kind(term)
+        if node_kind == Kind.CONSTANT:
+            return self.new_constant(term.value)
+        if node_kind == Kind.VARIABLE:
+            if term.name not in self.variables:
+                self.variables[term.name] = "v" + str(len(self.variables))
+            return self.variables[term.name]
+        if node_kind == Kind.UNARY:
+            value = self.emit(term.term)
+            una_op = symbol(term.una_op)
+            if una_op in UNA_OP_CODE:
+                return self.new_temporary(UNA_OP_CODE[una_op] + value)
+            return self.new_temporary(self.new_constant(UNA_OP_DICT[una_op]) + "(" + value + ")")
+        if node_kind == Kind.FUNCTION:
+            values = [self.emit(operand) for operand in term.terms]
+            function = self.new_constant(FUNCTION_DICT[symbol(term.function)][0])
+            return self.new_temporary(function + "(" + ", ".join(values) + ")")
+        left = self.emit(term.left)
+        right = self.emit(term.right)
+        bin_op = symbol(term.bin_op)
+        if bin_op in INLINE_BIN_OPS:
+            return self.new_temporary(left + " " + bin_op + " " + right)
+        return self.new_temporary(self.new_constant(BIN_OP_DICT[bin_op]) + "(" + left + ", " + right + ")")
+
+    def source(self, result: str) -> str:
+        """
+        Assembles the source code of a factory: the constants are its parameters,
+        thus they become the closure of the compiled function.
+        :param result: the local name holding the value of the root
+        :return: the source code
+        """
+        parameters = ", ".join("c" + str(i) for i in range(len(self.constants)))
+        code = ["def factory(" + parameters + "):",
+                "    def compiled(context):"]
+        if self.variables:
+            code.append("        get_value = context.get_value")
+        for name, local in self.variables.items():
+            code.append("        " + local + " = get_value(" + repr(name) + ")")
+        code += ["        " + line for line in self.lines]
+        code += ["        return " + result,
+                 "    return compiled"]
+        return "\n".join(code) + "\n"
+
+
+def compile_term(term: Any) -> Callable[[Any], float]:
+    """
+    Compiles a term of 'terms.py' or 'terms-enum.py' into a Python function.
+    The source code is available in the attribute 'source' of the function.
+    :param term: the term to compile
+    :return: function taking a context and returning the value of the term
+    """
+    generator = Code_generator()
+    result = generator.emit(term)
+    source = generator.source(result)
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, "<compiled term>", "exec"), namespace)
+    compiled = namespace["factory"](*generator.constants)
+    compiled.source = source
+    return compiled
+
+
+def main() -> None:
+    """ Launcher: benchmark of eval against the compiled function """
+    names = ["a", "b", "c", "d"]
+    for module in load_flavours():
+        print("Module", module.__name__)
+        print("depth  nodes   eval (us)  compiled (us)  speedup")
+        ctx = module.Context()
+        for name in names:
+            ctx.bind(name, random.Random(name).uniform(-2, 2))
+        for depth in [5, 10, 15, 20]:
+            term = random_term(module, depth, names)
+            compiled = term.compile()
+            assert compiled(ctx) == term.eval(ctx)
+            t_eval = best_time(lambda: term.eval(ctx), number=2000)
+            t_compiled = best_time(lambda: compiled(ctx), number=2000)
+            print("%5d  %5d  %10.2f  %13.2f  %6.1fx" % (depth, count_nodes(term), t_eval * 1e6,
+                                                         t_compiled * 1e6, t_eval / t_compiled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Hash-consing of terms: structurally identical subterms share one node.
+
+A factory keeps a table of all the nodes it has created. Before creating a node,
+the factory looks for a node with the same structure in the table and returns it
+if it exists. The key of a node is computed once from the kind, the operator and
+the identities of its children (which are themselves shared), thus hashing a node
+costs O(1) and two nodes of a factory are structurally equal iff they are the same
+object. A term becomes a DAG (directed acyclic graph) and 'eval_shared' evaluates
+each shared node only once per context.
+
+An 'Expression_set' merges many terms into one DAG and records its nodes on a
+tape (see terms_tape) in topological order, the operands before the operators.
+Its method 'eval' computes each distinct subterm once and returns the values
+of all the terms:
+
+    expressions = Expression_set([term1, term2, term3])
+    expressions.eval(ctx)               # [term1.eval(ctx), term2.eval(ctx), term3.eval(ctx)]
+"""
+
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, module_of, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_tape import Tape
+from terms_bench import load_flavours, operators, random_leaf, random_term, count_nodes, best_time
+
+
+class Term_factory:
+    """
+    Creates the shared nodes of a flavour of terms ('terms' or 'terms-enum').
+    """
+
+    def __init__(self, module: ModuleType) -> None:
+        """
+        :param module: the module whose classes are used to create the nodes
+        """
+        self.module = module
+        self.table: Dict[Tuple[Any, ...], Any] = {}  # structural key -> node
+        self.owned: Set[int] = set()  # identities of the nodes of the table
+
+    def __len__(self) -> int:
+        """
+        :return: the number of distinct nodes created by the factory
+        """
+        return len(self.table)
+
+    def shared(self, key: Tuple[Any, ...], create: Callable[[], Any]) -> Any:
+        """
+        Returns the node of the given key, the node is created if needed.
+        :param key: structural key of the node
+        :param create: function creating the node if it does not exist yet
+        :return: the shared node
+        """
+        node = self.table.get(key)
+        if node is None:
+            node = create()
+            self.table[key] = node
+            self.owned.add(id(node))
+        return node
+
+    def constant(self, value: float) -> Any:
+        """
+        :return: the shared constant of the given value
+        """
+        # the type and repr distinguish 1 from 1.0 and 0.0 from -0.0
+        key = (Kind.CONSTANT, type(value), repr(value))
+        return self.shared(key, lambda: self.module.Constant(value))
+
+    def variable(self, name: str) -> Any:
+        """
+        :return: the shared variable of the given name
+        """
+        return self.shared((Kind.VARIABLE, name), lambda: self.module.Variable(name))
+
+    def unary(self, term: Any, una_op: Any) -> Any:
+        """
+        :return: the shared unary expression, the term is interned first
+        """
+        term = self.intern(term)
+        return self.shared((Kind.UNARY, id(term), una_op),
+                           lambda: self.module.Unary_expression(term, una_op))
+
+    def binary(self, left: Any, right: Any, bin_op: Any) -> Any:
+        """
+        :return: the shared binary expression, both terms are interned first
+        """
+        left = self.intern(left)
+        right = self.intern(right)
+        return self.shared((Kind.BINARY, id(left), id(right), bin_op),
+                           lambda: self.module.Binary_expression(left, right, bin_op))
+
+    def function(self, terms: List[Any], function: Any) -> Any:
+        """
+        :return: the shared function expression, the terms are interned first
+        """
+        terms = [self.intern(term) for term in terms]
+        return self.shared((Kind.FUNCTION, tuple(id(term) for term in terms), function),
+                           lambda: self.module.Function_expression(terms, function))
+
+    def intern(self, term: Any) -> Any:
+        """
+        Converts a term (tree) into its shared version (DAG).
+        :param term: any term of the flavour of the factory
+        :return: the shared node structurally equal to the term
+        """
+        if id(term) in self.owned:
+            return term
+        node_kind = kind(term)
+        if node_kind == Kind.CONSTANT:
+            return self.constant(term.value)
+        if node_kind == Kind.VARIABLE:
+            return self.variable(term.name)
+        if node_kind == Kind.UNARY:
+            return self.unary(term.term, term.una_op)
+        if node_kind == Kind.FUNCTION:
+            return self.function(term.terms, term.function)
+        return self.binary(term.left, term.right, term.bin_op)
+
+
+def eval_shared(term: Any, context: Any, memo: Optional[Dict[int, Any]] = None) -> float:
+    """
+    Evaluates a term like 'eval' but each shared node is evaluated only once.
+    :param term: term (tree or DAG) of 'terms.py' or 'terms-enum.py'
+    :param context: where the bindings (variable name, value) are stored
+    :param memo: values of the nodes already evaluated for this context
+    :return: the value of the term
+    """
+    if memo is None:
+        memo = {}
+    value = memo.get(id(term))
+    if value is not None:
+        return value
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        value = term.value
+    elif node_kind == Kind.VARIABLE:
+        value = context.get_value(term.name)
+    elif node_kind == Kind.UNARY:
+        value = UNA_OP_DICT[symbol(term.una_op)](eval_shared(term.term, context, memo))
+    elif node_kind == Kind.FUNCTION:
+        values = [eval_shared(operand, context, memo) for operand in term.terms]
+        value = FUNCTION_DICT[symbol(term.function)][0](*values)
+    else:
+        value_left = eval_shared(term.left, context, memo)
+        value_right = eval_shared(term.right, context, memo)
+        value = BIN_OP_DICT[symbol(term.bin_op)](value_left, value_right)
+    memo[id(term)] = value
+    return value
+
+
+class Expression_set:
+    """
+    Terms evaluated together: the shared subterms are evaluated once per context.
+    """
+
+    def __init__(self, terms: List[Any]) -> None:
+        """
+        Merges the terms into one DAG and orders its nodes.
+        :param terms: terms of the same flavour, 'terms.py' or 'terms-enum.py'
+        """
+        self.factory = Term_factory(module_of(terms[0])) if terms else None
+        self.terms = [self.factory.intern(term) for term in terms] if terms else []
+        self.tape = Tape(self.terms[0]) if terms else None
+        self.roots = [self.tape.record(term) for term in self.terms] if terms else []
+        self.constants: List[Any] = []  # value of each node, the constants are set once
+        self.variables: List[Tuple[int, str]] = []  # (position, name)
+        # (number of operands, operation, position, first operand, second operand, all the operands)
+        self.steps: List[Tuple[int, Callable[..., Any], int, int, int, Tuple[int, ...]]] = []
+        if self.tape is None:
+            return
+        for position, (node_kind, argument, operands) in enumerate(zip(self.tape.kinds, self.tape.arguments,
+                                                                       self.tape.operands)):
+            self.constants.append(argument if node_kind == Kind.CONSTANT else None)
+            if node_kind == Kind.VARIABLE:
+                self.variables.append((position, argument))
+            elif node_kind != Kind.CONSTANT:
+                if node_kind == Kind.BINARY:
+                    operation = BIN_OP_DICT[argument]
+                elif node_kind == Kind.UNARY:
+                    operation = UNA_OP_DICT[argument]
+                else:
+                    operation = FUNCTION_DICT[argument][0]
+                first = operands[0] if operands else -1
+                second = operands[1] if len(operands) > 1 else -1
+                self.steps.append((len(operands), operation, position, first, second, operands))
+
+    def __len__(self) -> int:
+        """
+        :return: the number of distinct nodes of the DAG
+        """
+        return len(self.constants)
+
+    def eval(self, context: Any) -> List[float]:
+        """
+        Evaluates all the terms, each distinct subterm once.
+        :param context: where the bindings (variable name, value) are stored
+        :return: the values of the terms, in the order of the terms given to the constructor
+        """
+        values = self.constants.copy()
+        get_value = context.get_value
+        for position, name in self.variables:
+            values[position] = get_value(name)
+        for arity, operation, position, first, second, operands in self.steps:
+            if arity == 2:
+                values[position] = operation(values[first], values[second])
+            elif arity == 1:
+                values[position] = operation(values[first])
+            else:
+                values[position] = operation(*[values[operand] for operand in operands])
+        return [values[root] for root in self.roots]
+
+
+def copy_term(module: ModuleType, term: Any) -> Any:
+    """
+    :return: a copy of the term where no node is shared
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return module.Constant(term.value)
+    if node_kind == Kind.VARIABLE:
+        return module.Variable(term.name)
+    if node_kind == Kind.UNARY:
+        return module.Unary_expression(copy_term(module, term.term), term.una_op)
+    if node_kind == Kind.FUNCTION:
+        return module.Function_expression([copy_term(module, operand) for operand in term.terms], term.function)
+    return module.Binary_expression(copy_term(module, term.left), copy_term(module, term.right), term.bin_op)
+
+
+def duplicated_corpus(module: ModuleType, size: int, rng: random.Random) -> List[Any]:
+    """
+    Generates terms that reuse earlier terms as subterms: each new term combines
+    two terms of the corpus, copied so that the trees do not share any node.
+    :return: the list of the terms of the corpus
+    """
+    bin_ops, neg = operators(module)
+    corpus = [random_leaf(module, ["a", "b", "c"], rng) for _ in range(8)]
+    while len(corpus) < size:
+        left, right = rng.sample(corpus[-20:], 2)
+        term = module.Binary_expression(copy_term(module, left), copy_term(module, right), rng.choice(bin_ops))
+        if count_nodes(term) > 5000:
+            term = module.Unary_expression(copy_term(module, left), neg)
+        corpus.append(term)
+    return corpus
+
+
+def main() -> None:
+    """ Launcher: node count and evaluation time of trees against the shared DAG """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        ctx = module.Context()
+        for name, value in [("a", 1.5), ("b", -0.25), ("c", 0.75)]:
+            ctx.bind(name, value)
+        corpus = duplicated_corpus(module, 200, random.Random(3))
+        factory = Term_factory(module)
+        shared = [factory.intern(term) for term in corpus]
+        memo: Dict[int, Any] = {}
+        assert [eval_shared(term, ctx, memo) for term in shared] == [term.eval(ctx) for term in corpus]
+        tree_nodes = sum(count_nodes(term) for term in corpus)
+        print("nodes: trees %d, DAG %d (%.1fx fewer)" % (tree_nodes, len(factory), tree_nodes / len(factory)))
+
+        def shared_corpus() -> None:
+            memo: Dict[int, Any] = {}  # one memo for the whole corpus and context
+            for term in shared:
+                eval_shared(term, ctx, memo)
+
+        t_eval = best_time(lambda: [term.eval(ctx) for term in corpus], repeat=3)
+        t_shared = best_time(shared_corpus, repeat=3)
+        print("eval: trees %.4f s, DAG %.4f s (%.1fx faster)" % (t_eval, t_shared, t_eval / t_shared))
+
+        # dashboard: many related terms built from the same subterms, evaluated together
+        rng = random.Random(8)
+        bin_ops, neg = operators(module)
+        subterms = [random_term(module, 30, ["a", "b", "c"], rng) for _ in range(20)]
+        dashboard = [module.Binary_expression(copy_term(module, rng.choice(subterms)),
+                                              copy_term(module, rng.choice(subterms)), rng.choice(bin_ops))
+                     for _ in range(300)]
+        t_build = best_time(lambda: Expression_set(dashboard), repeat=1)
+        expressions = Expression_set(dashboard)
+        assert expressions.eval(ctx) == [term.eval(ctx) for term in dashboard]
+        t_each = best_time(lambda: [term.eval(ctx) for term in dashboard], repeat=3)
+        t_set = best_time(lambda: expressions.eval(ctx), repeat=3, number=100)
+        print("%d expressions, %d nodes, %d distinct: eval of each %.4f s, Expression_set %.4f s (%.1fx faster),"
+              " built in %.3f s" % (len(dashboard), sum(count_nodes(term) for term in dashboard), len(expressions),
+                                    t_each, t_set, t_each / t_set, t_build))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Reverse-mode automatic differentiation of terms.
+
+The nodes of the term are recorded on a tape (see terms_tape) in postfix order,
+the operands before the operator. The forward sweep computes the value of each
+node along the tape, then the backward sweep walks the tape in the reverse order
+and propagates the adjoints (derivative of the root with respect to each node)
+with the derivatives of the operators, given by the tables BIN_DERIVATIVES,
+UNA_DERIVATIVES and FUNCTION_DERIVATIVES:
+
+    l + r  ->  (1, 1)         l * r  ->  (r, l)          -t       ->  -1
+    l - r  ->  (1, -1)        l / r  ->  (1/r, -l/r^2)   sqrt(t)  ->  1/(2 sqrt(t))
+    l ** r ->  (r l^(r-1), l^r ln(l))                     exp(t)   ->  exp(t)
+
+An operator registered in terms_ops without an entry in these tables cannot be
+differentiated (KeyError). The derivatives which divide by an operand are
+computed with NumPy floats, also for Python scalars, thus where eval is defined
+but not its derivative (sqrt at 0, l ** r at l = 0 with r < 1) the partial
+derivative is inf or nan instead of an exception.
+
+The value and all the partial derivatives are obtained with one forward and one
+backward sweep, whereas finite differences need 2 evaluations per variable.
+The same sweeps work with NumPy arrays (gradient_batch) to differentiate the
+term for many rows of bindings at once.
+"""
+
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+import numpy as np
+from terms_ops import Kind, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_tape import Tape
+from terms_batch import columns_of, apply, BIN_OP_UFUNC, UNA_OP_UFUNC, FUNCTION_UFUNC
+from terms_bench import load_flavours, operators, best_time
+
+
+# partial derivatives of the operators: function of the values of the operands
+# and of the value of the node -> one partial derivative per operand
+BIN_DERIVATIVES: Dict[str, Callable[[Any, Any, Any], Tuple[Any, Any]]] = {
+    "+": lambda l, r, value: (1, 1),
+    "-": lambda l, r, value: (1, -1),
+    "*": lambda l, r, value: (r, l),
+    "/": lambda l, r, value: (1 / r, -l / (r * r)),
+    "**": lambda l, r, value: (r * np.power(l, r - 1, dtype=np.float64), value * np.log(l)),
+    "%": lambda l, r, value: (1, -np.floor(l / r)),
+    "min": lambda l, r, value: ((l <= r) * 1.0, (l > r) * 1.0),
+    "max": lambda l, r, value: ((l >= r) * 1.0, (l < r) * 1.0)
+}
+
+UNA_DERIVATIVES: Dict[str, Callable[[Any, Any], Tuple[Any]]] = {"-": lambda t, value: (-1,)}
+
+FUNCTION_DERIVATIVES: Dict[str, Callable[..., Tuple[Any, ...]]] = {
+    "sqrt": lambda t, value: (np.float64(0.5) / value,),
+    "exp": lambda t, value: (value,)
+}
+
+
+def sweep(tape: Tape, lookup: Callable[[str], Any], seed: Any, batch: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Forward and backward sweeps, the values are floats or NumPy arrays.
+    :param tape: the recorded term
+    :param lookup: function giving the value of a variable
+    :param seed: derivative of the root with respect to itself (1 or array of ones)
+    :param batch: True if the values are arrays, the operators are then applied element-wise
+    :return: tuple (value of the term, dictionary (name of variable, partial derivative))
+    """
+    values: List[Any] = []
+    for node_kind, argument, operands in zip(tape.kinds, tape.arguments, tape.operands):
+        if node_kind == Kind.CONSTANT:
+            values.append(argument)
+        elif node_kind == Kind.VARIABLE:
+            values.append(lookup(argument))
+        else:
+            if node_kind == Kind.BINARY:
+                ufuncs, operation = BIN_OP_UFUNC, BIN_OP_DICT[argument]
+            elif node_kind == Kind.UNARY:
+                ufuncs, operation = UNA_OP_UFUNC, UNA_OP_DICT[argument]
+            else:
+                ufuncs, operation = FUNCTION_UFUNC, FUNCTION_DICT[argument][0]
+            operand_values = [values[operand] for operand in operands]
+            values.append(apply(ufuncs, argument, operation, operand_values) if batch
+                          else operation(*operand_values))
+
+    adjoints: List[Any] = [0] * len(values)
+    adjoints[-1] = seed
+    gradient: Dict[str, Any] = {}
+    for position in range(len(values) - 1, -1, -1):
+        node_kind = tape.kinds[position]
+        adjoint = adjoints[position]
+        argument = tape.arguments[position]
+        if node_kind == Kind.VARIABLE:
+            gradient[argument] = gradient.get(argument, 0) + adjoint
+        elif node_kind != Kind.CONSTANT:
+            if node_kind == Kind.BINARY:
+                derivative = BIN_DERIVATIVES[argument]
+            elif node_kind == Kind.UNARY:
+                derivative = UNA_DERIVATIVES[argument]
+            else:
+                derivative = FUNCTION_DERIVATIVES[argument]
+            operands = tape.operands[position]
+            partials = derivative(*[values[operand] for operand in operands], values[position])
+            for operand, partial in zip(operands, partials):
+                adjoints[operand] += adjoint * partial
+    return values[-1], gradient
+
+
+def gradient(term: Any, context: Any) -> Tuple[float, Dict[str, float]]:
+    """
+    Computes the value of a term and its partial derivatives with respect to
+    each of its variables.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param context: where the bindings (variable name, value) are stored
+    :return: tuple (value of the term, dictionary (name of variable, partial derivative))
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sweep(Tape(term), context.get_value, 1.0)
+
+
+def gradient_batch(term: Any, bindings: Any) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Same as gradient but for each row of columns of values (see terms_batch).
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param bindings: dictionary (name, values) or a context whose values are arrays
+    :return: tuple (values of the term, dictionary (name of variable, partial derivatives))
+    """
+    columns = columns_of(bindings)
+    rows = next(iter(columns.values())).shape if columns else ()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value, partials = sweep(Tape(term), columns.__getitem__, np.ones(rows), batch=True)
+    return (np.broadcast_to(np.float64(value), rows).copy(),
+            {name: np.broadcast_to(np.float64(partial), rows).copy() for name, partial in partials.items()})
+
+
+def finite_differences(term: Any, context: Any, names: List[str], h: float = 1e-6) -> Dict[str, float]:
+    """
+    :return: the partial derivatives estimated with central differences (2 evaluations per variable)
+    """
+    partials = {}
+    for name in names:
+        value = context.get_value(name)
+        context.bind(name, value + h)
+        above = term.eval(context)
+        context.bind(name, value - h)
+        below = term.eval(context)
+        context.bind(name, value)
+        partials[name] = (above - below) / (2 * h)
+    return partials
+
+
+def balanced_term(module: ModuleType, names: List[str], rng: random.Random) -> Any:
+    """
+    Builds a term of depth log(n) combining the products c * x of the variables.
+    """
+    bin_ops, neg = operators(module)
+    terms = [module.Binary_expression(module.Constant(rng.randint(1, 9)), module.Variable(name), bin_ops[2])
+             for name in names]
+    while len(terms) > 1:
+        paired = [module.Binary_expression(terms[i], terms[i + 1], rng.choice(bin_ops))
+                  for i in range(0, len(terms) - 1, 2)]
+        terms = paired + terms[len(terms) - len(terms) % 2:]
+    return terms[0]
+
+
+def main() -> None:
+    """ Launcher: benchmark of reverse-mode differentiation against finite differences """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        print("variables  gradient (ms)  finite differences (ms)  speedup")
+        for count in [10, 100, 1000]:
+            names = ["x" + str(i) for i in range(count)]
+            term = balanced_term(module, names, random.Random(count))
+            ctx = module.Context()
+            for name in names:
+                ctx.bind(name, random.Random(name).uniform(-1, 1))
+            value, partials = gradient(term, ctx)
+            estimate = finite_differences(term, ctx, names)
+            assert value == term.eval(ctx)
+            # rounding error of the differences: about 1e-16 * |value| / h
+            tolerance = 1e-9 * abs(value)
+            assert all(abs(partials[name] - estimate[name]) <= 1e-4 * (1 + abs(estimate[name])) + tolerance
+                       for name in names)
+            repeat = 3 if count < 1000 else 1
+            t_gradient = best_time(lambda: gradient(term, ctx), repeat=repeat)
+            t_differences = best_time(lambda: finite_differences(term, ctx, names), repeat=repeat)
+            print("%9d  %13.2f  %23.2f  %6.0fx" % (count, t_gradient * 1e3, t_differences * 1e3,
+                                                   t_differences / t_gradient))
+        # the reverse mode keeps the values of all the nodes: one array per node
+        names = names[:100]
+        term = balanced_term(module, names, random.Random(len(names)))
+        columns = {name: np.random.default_rng(0).uniform(-1, 1, 10000) for name in names}
+        t_batch = best_time(lambda: gradient_batch(term, columns), repeat=1)
+        print("gradient_batch: %d variables, 10000 rows in %.3f s" % (len(names), t_batch))
+
+
+if __name__ == "__main__":
+    main()
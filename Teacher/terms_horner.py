@@ -0,0 +1,314 @@
+"""
+Rewriting of the polynomials of a term into Horner form.
+
+A polynomial in one variable written as a sum of monomials evaluates every
+power from scratch, e.g. a*x*x*x + b*x*x + c*x + d needs 6 multiplications and
+3 additions. Its Horner form ((a*x + b)*x + c)*x + d needs 3 multiplications
+and 3 additions. When some coefficients are zero, the gaps between the degrees
+are powers of x computed once by squaring and shared by the Horner steps:
+
+    x^10 + 3*x^2 + 1   ->   ((x^8 + 3) * x^2) + 1   with x^2 = x*x, x^4 = x^2*x^2, x^8 = x^4*x^4
+
+'horner' looks for the largest subterms which are polynomials in a single
+variable: built with +, -, *, the negation, the constants and the powers by a
+constant natural number (**). The other subterms are kept, their operands are
+rewritten. A polynomial is replaced only if its Horner form has fewer operations
+executed by 'eval'. The method 'eval' walks the tree, thus it computes a shared
+power each time it is reached: x^8 costs 7 multiplications and not 3. The sharing
+pays off only with eval_shared or Expression_set (terms_dag), which compute each
+node once, see count_operations(term, shared=True).
+
+The coefficients are computed with the operations of Python, thus for integer
+constants and integer values the Horner form gives exactly the same values. A
+polynomial whose monomials cancel out, e.g. (x + 1) - x or x * 0 + 2, is not
+rewritten: with floats the cancelled degrees change the values, (x + 1) - x is
+0.0 and not 1 for x = 1e17, and nan and not 1 for x = inf. The coefficients of
+the same degree are still collected, thus with floats the rounding differs and
+inf or nan may give other values: 2*x - x gives nan for x = inf, its Horner form
+x gives inf.
+"""
+
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, module_of, to_string, bin_op_of, una_op_of
+from terms_tape import Tape
+from terms_bench import load_flavours, operators, best_time
+
+# a polynomial: degree -> coefficient, the coefficients are not zero
+Polynomial = Dict[int, Any]
+
+MAX_DEGREE = 64  # larger polynomials are left as they are
+
+
+def add(p: Polynomial, q: Polynomial, sign: int = 1) -> Polynomial:
+    """
+    :return: the polynomial p + q, or p - q if sign is -1
+    """
+    result = dict(p)
+    for degree, coefficient in q.items():
+        result[degree] = result.get(degree, 0) + sign * coefficient
+    return {degree: coefficient for degree, coefficient in result.items() if coefficient != 0}
+
+
+def multiply(p: Polynomial, q: Polynomial) -> Polynomial:
+    """
+    :return: the polynomial p * q
+    """
+    result: Polynomial = {}
+    for degree_p, coefficient_p in p.items():
+        for degree_q, coefficient_q in q.items():
+            degree = degree_p + degree_q
+            result[degree] = result.get(degree, 0) + coefficient_p * coefficient_q
+    return {degree: coefficient for degree, coefficient in result.items() if coefficient != 0}
+
+
+def polynomial(term: Any) -> Optional[Tuple[Optional[str], Polynomial]]:
+    """
+    Converts a term into a polynomial in one variable.
+    :return: tuple (name of the variable or None for a constant term, polynomial),
+             None if the term is not a polynomial in a single variable
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return None, ({0: term.value} if term.value != 0 else {})
+    if node_kind == Kind.VARIABLE:
+        return term.name, {1: 1}
+    if node_kind == Kind.UNARY:
+        operand = polynomial(term.term) if symbol(term.una_op) == "-" else None
+        if operand is None:
+            return None
+        return operand[0], {degree: -coefficient for degree, coefficient in operand[1].items()}
+    if node_kind != Kind.BINARY:
+        return None
+    op = symbol(term.bin_op)
+    if op == "**":
+        base = polynomial(term.left)
+        exponent = term.right.value if kind(term.right) == Kind.CONSTANT else None
+        if base is None or type(exponent) != int or exponent < 0 \
+                or exponent * max(base[1], default=0) > MAX_DEGREE:
+            return None
+        result: Polynomial = {0: 1}
+        for _ in range(exponent):
+            result = multiply(result, base[1])
+        return base[0], result
+    if op not in ("+", "-", "*"):
+        return None
+    left = polynomial(term.left)
+    right = polynomial(term.right)
+    if left is None or right is None:
+        return None
+    if left[0] is not None and right[0] is not None and left[0] != right[0]:
+        return None  # two variables
+    name = left[0] if left[0] is not None else right[0]
+    if op == "*":
+        if max(left[1], default=0) + max(right[1], default=0) > MAX_DEGREE:
+            return None
+        return name, multiply(left[1], right[1])
+    return name, add(left[1], right[1], 1 if op == "+" else -1)
+
+
+def degrees(term: Any) -> Set[int]:
+    """
+    :param term: a term converted by polynomial
+    :return: the degrees of its monomials before any cancellation, a constant 0 has the degree 0
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return {0}
+    if node_kind == Kind.VARIABLE:
+        return {1}
+    if node_kind == Kind.UNARY:
+        return degrees(term.term)
+    op = symbol(term.bin_op)
+    if op == "**":
+        base = degrees(term.left)
+        result = {0}
+        for _ in range(term.right.value):
+            result = {degree + other for degree in result for other in base}
+        return result
+    left, right = degrees(term.left), degrees(term.right)
+    if op == "*":
+        return {degree + other for degree in left for other in right}
+    return left | right
+
+
+class Horner_builder:
+    """
+    Builds the Horner form of polynomials in a variable, the powers of the
+    variable are created once and shared.
+    """
+
+    def __init__(self, module: ModuleType, name: str) -> None:
+        self.module = module
+        self.powers: Dict[int, Any] = {1: module.Variable(name)}
+        self.add, self.sub, self.mul = bin_op_of(module, "+"), bin_op_of(module, "-"), bin_op_of(module, "*")
+        self.neg = una_op_of(module, "-")
+
+    def power(self, exponent: int) -> Any:
+        """
+        :return: the term of x^exponent (exponent >= 1) by squaring
+        """
+        if exponent not in self.powers:
+            half = self.power(exponent // 2)
+            square = self.module.Binary_expression(half, half, self.mul)
+            self.powers[exponent] = square if exponent % 2 == 0 else \
+                self.module.Binary_expression(square, self.powers[1], self.mul)
+        return self.powers[exponent]
+
+    def times_power(self, term: Optional[Any], coefficient: Any, exponent: int) -> Any:
+        """
+        :param term: the term computed so far, None stands for the constant 'coefficient'
+        :return: the term * x^exponent
+        """
+        if exponent == 0:
+            return term if term is not None else self.module.Constant(coefficient)
+        power = self.power(exponent)
+        if term is not None:
+            return self.module.Binary_expression(term, power, self.mul)
+        if coefficient == 1:
+            return power
+        if coefficient == -1:
+            return self.module.Unary_expression(power, self.neg)
+        return self.module.Binary_expression(self.module.Constant(coefficient), power, self.mul)
+
+    def build(self, p: Polynomial) -> Any:
+        """
+        :param p: a polynomial which is not zero
+        :return: the term of the polynomial in Horner form
+        """
+        degrees = sorted(p, reverse=True)
+        term: Optional[Any] = None
+        for current, following in zip(degrees, degrees[1:] + [0]):
+            if term is not None:
+                coefficient = p[current]
+                if coefficient < 0:
+                    term = self.module.Binary_expression(term, self.module.Constant(-coefficient), self.sub)
+                else:
+                    term = self.module.Binary_expression(term, self.module.Constant(coefficient), self.add)
+            term = self.times_power(term, p[current], current - following)
+        return term
+
+
+def count_operations(term: Any, shared: bool = False) -> Tuple[int, int]:
+    """
+    :param shared: False to count the operations executed by eval, a shared node is counted
+                   each time it is reached, True to count a shared node once (eval_shared of terms_dag)
+    :return: tuple (number of operators, number of multiplications)
+    """
+    if shared:
+        tape = Tape(term)
+        operations = [argument for node_kind, argument in zip(tape.kinds, tape.arguments)
+                      if node_kind != Kind.CONSTANT and node_kind != Kind.VARIABLE]
+        return len(operations), operations.count("*")
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT or node_kind == Kind.VARIABLE:
+        return 0, 0
+    if node_kind == Kind.UNARY:
+        operands = [term.term]
+    elif node_kind == Kind.FUNCTION:
+        operands = term.terms
+    else:
+        operands = [term.left, term.right]
+    counts = [count_operations(operand) for operand in operands]
+    multiplication = 1 if node_kind == Kind.BINARY and symbol(term.bin_op) == "*" else 0
+    return 1 + sum(count[0] for count in counts), multiplication + sum(count[1] for count in counts)
+
+
+def horner(term: Any) -> Any:
+    """
+    Rewrites the polynomial subterms of a term into Horner form. The given term is
+    not modified, the unchanged subterms are shared with the result.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :return: an equivalent term
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT or node_kind == Kind.VARIABLE:
+        return term
+    module = module_of(term)
+    found = polynomial(term)
+    if found is not None and found[0] is not None and found[1] and set(found[1]) == degrees(term):
+        rewritten = Horner_builder(module, found[0]).build(found[1])
+        if count_operations(rewritten)[0] < count_operations(term)[0]:
+            return rewritten
+        return term
+    if node_kind == Kind.UNARY:
+        operand = horner(term.term)
+        return term if operand is term.term else module.Unary_expression(operand, term.una_op)
+    if node_kind == Kind.FUNCTION:
+        operands = [horner(operand) for operand in term.terms]
+        if all(operand is original for operand, original in zip(operands, term.terms)):
+            return term
+        return module.Function_expression(operands, term.function)
+    left = horner(term.left)
+    right = horner(term.right)
+    if left is term.left and right is term.right:
+        return term
+    return module.Binary_expression(left, right, term.bin_op)
+
+
+def monomials(module: ModuleType, coefficients: List[int], name: str) -> Any:
+    """
+    Builds the polynomial sum of c_k * x * ... * x (k times) with the
+    coefficients of the degrees 0, 1, 2, ..., the zero coefficients are skipped.
+    """
+    bin_ops, neg = operators(module)
+    term = None
+    for degree, coefficient in enumerate(coefficients):
+        if coefficient == 0:
+            continue
+        monomial = module.Constant(coefficient)
+        for _ in range(degree):
+            monomial = module.Binary_expression(monomial, module.Variable(name), bin_ops[2])
+        term = monomial if term is None else module.Binary_expression(monomial, term, bin_ops[0])
+    return term
+
+
+def main() -> None:
+    """ Launcher: operations executed by eval and eval time before and after the rewriting """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        bin_ops, neg = operators(module)
+        rng = random.Random(6)
+        sparse = [1] + [0] * 9 + [1]
+        sparse[2] = 3
+        examples = [monomials(module, [4, 3, 2, 1], "x"),
+                    monomials(module, [rng.randint(-9, 9) for _ in range(9)], "x"),
+                    monomials(module, [rng.randint(-9, 9) for _ in range(21)], "x"),
+                    monomials(module, sparse, "x"),
+                    module.Binary_expression(monomials(module, [1, 2, 3], "x"),
+                                             monomials(module, [5, 0, 0, 7], "y"), bin_ops[2])]
+        print("operations (*)   after (*)  shared   eval (us)  after (us)  term")
+        for term in examples:
+            rewritten = horner(term)
+            ctx = module.Context()
+            for _ in range(200):  # integer values: the same values exactly
+                ctx.bind("x", rng.randint(-50, 50))
+                ctx.bind("y", rng.randint(-50, 50))
+                assert term.eval(ctx) == rewritten.eval(ctx)
+            for _ in range(200):
+                ctx.bind("x", rng.uniform(-2, 2))
+                ctx.bind("y", rng.uniform(-2, 2))
+                expected = term.eval(ctx)
+                assert abs(rewritten.eval(ctx) - expected) <= 1e-9 * max(1, abs(expected))
+            before, after = count_operations(term), count_operations(rewritten)
+            shared = count_operations(rewritten, shared=True)[0]  # operations of eval_shared
+            t_before = best_time(lambda: term.eval(ctx), number=2000)
+            t_after = best_time(lambda: rewritten.eval(ctx), number=2000)
+            text = to_string(rewritten)
+            print("%10d (%3d)  %5d (%3d)  %6d  %10.2f  %10.2f  %s" % (before[0], before[1], after[0], after[1],
+                                                                     shared, t_before * 1e6, t_after * 1e6,
+                                                                     text if len(text) < 50 else text[:47] + "..."))
+        x = module.Variable("x")
+        for term in [module.Binary_expression(module.Binary_expression(x, module.Constant(1), bin_ops[0]), x,
+                                              bin_ops[1]),
+                     module.Binary_expression(module.Binary_expression(x, module.Constant(0), bin_ops[2]),
+                                              module.Constant(2), bin_ops[0])]:
+            assert horner(term) is term  # the cancelled monomials are kept
+            print("not rewritten:", to_string(term))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Incremental parsing of an expression read by chunks.
+
+'Parser' needs the whole expression as one string, a generated expression of
+hundreds of MB is then held in memory as text and indexed character by
+character. 'Stream_parser' reads the expression from a source by chunks:
+
+    a text or binary file object        open("expr.txt"), open("expr.txt", "rb")
+    bytes, or a memory map of a file    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    an iterable of str or bytes chunks  ["((12", ".5+x)", "*3)"]
+
+A number or an identifier cut by the end of a chunk is read again with the next
+chunk, thus the tokens are the same as with Table_parser. The parse is the one
+of Iterative_parser, so the memory of the parser is a chunk and a stack of the
+depth of the expression:
+
+    term = parse_stream(open("expr.txt"), terms)
+
+The term itself grows with the expression. 'Evaluating_builder' stands for the
+module of the terms and computes the values instead of building the nodes, the
+whole memory used is then proportional to the depth of the expression only:
+
+    value = parse_stream(open("expr.txt"), Evaluating_builder(context))
+"""
+
+import io
+import os
+import mmap
+import random
+import tempfile
+import tracemalloc
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable, Iterator, TextIO
+from terms_ops import BIN_OP_DICT, to_string
+from terms_parsing import ParsingException, Token, Table_parser, Iterative_table_parser, parse_expression, \
+    random_expression
+from terms_bench import load_flavours, best_time
+
+CHUNK_SIZE = 1 << 16  # characters read at once
+
+
+def chunks_of(source: Any, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Reads a source by chunks, the bytes are decoded as latin-1: a byte is a character.
+    :param source: file object, bytes, memory map or iterable of chunks
+    :param chunk_size: number of characters of a chunk read from a file or a buffer
+    :return: iterator of the chunks of text
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size]).decode("latin-1")
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk.decode("latin-1") if isinstance(chunk, bytes) else chunk
+    else:
+        for chunk in source:
+            yield chunk.decode("latin-1") if isinstance(chunk, (bytes, bytearray)) else chunk
+
+
+class Stream_parser(Iterative_table_parser):
+    """
+    Iterative parser with the lexer of Table_parser, the expression is read by chunks.
+    """
+
+    def __init__(self, source: Any, module: Any, chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Initialises the source to parse.
+        :param source: file object, bytes, memory map or iterable of chunks
+        :param module: 'terms', 'terms-enum' or an Evaluating_builder
+        :param chunk_size: number of characters read at once from a file or a buffer
+        """
+        self.chunks = chunks_of(source, chunk_size)
+        self.exhausted = False  # all the chunks have been read
+        super().__init__("", module)
+
+    def next_token(self) -> Tuple[Token, Any]:
+        """
+        Determines the next token, reads the next chunk when the buffer is exhausted
+        or when the token may continue in the next chunk.
+        :return: tuple with the read token and its value
+        """
+        while True:
+            start = self.idx
+            token = super().next_token()
+            if self.exhausted:
+                return token
+            if token[0] == Token.END \
+                    or ((token[0] == Token.CTE or token[0] == Token.VAR) and self.idx == self.length) \
+                    or (token[0] == Token.ERR and self.idx == self.length - 1 and self.expr[self.idx] == "."):
+                self.refill(start)  # the token is read again with the next chunk
+            else:
+                return token
+
+    def refill(self, start: int) -> None:
+        """
+        Replaces the characters of the buffer before 'start' by the next chunk.
+        """
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            chunk = ""
+        self.expr = self.expr[start:] + chunk
+        self.idx = 0
+        self.length = len(self.expr)
+
+
+class Evaluating_builder:
+    """
+    Stands for a module of terms: the 'terms' built by a parser are the values of
+    the expressions, the variables are read in a context.
+    """
+
+    def __init__(self, context: Any = None) -> None:
+        self.context = context
+
+    @staticmethod
+    def Constant(value: float) -> float:
+        return value
+
+    def Variable(self, name: str) -> float:
+        return self.context.get_value(name)
+
+    @staticmethod
+    def Binary_expression(left: float, right: float, bin_op: str) -> float:
+        return BIN_OP_DICT[bin_op](left, right)
+
+
+def parse_stream(source: Any, module: Any, chunk_size: int = CHUNK_SIZE) -> Any:
+    """
+    Parses a whole expression read by chunks, all the tokens must be read.
+    :param source: file object, bytes, memory map or iterable of chunks
+    :param module: 'terms', 'terms-enum' or an Evaluating_builder
+    :param chunk_size: number of characters read at once from a file or a buffer
+    :return: the term of the expression, or its value with an Evaluating_builder
+    """
+    parser = Stream_parser(source, module, chunk_size)
+    term = parser.parse()
+    if parser.current[0] != Token.END:
+        raise ParsingException("Parenthesis not balanced")
+    return term
+
+
+def write_balanced(file: TextIO, depth: int, rng: random.Random) -> None:
+    """
+    Writes a random expression whose binary operators form a complete tree of the
+    given depth, the leaves are numbers with decimals and the variable x.
+    """
+    if depth == 0:
+        file.write(rng.choice(["1.25", "x", "0.5", "3"]))
+        return
+    file.write("(")
+    write_balanced(file, depth - 1, rng)
+    file.write(rng.choice([" + ", " - "]))
+    write_balanced(file, depth - 1, rng)
+    file.write(")")
+
+
+def main() -> None:
+    """ Launcher: same terms as Table_parser, peak memory against the size and the depth of the input """
+    module = load_flavours()[0]
+    rng = random.Random(8)
+    for _ in range(300):
+        expr = random_expression(8, rng).replace("7", " 712.25 ").replace("3", "rate_3").replace("+", " + ")
+        expected = to_string(parse_expression(expr, module, Table_parser))
+        for chunk_size in [1, 2, 3, 7, 4096]:
+            assert to_string(parse_stream(io.StringIO(expr), module, chunk_size)) == expected
+            assert to_string(parse_stream(expr.encode(), module, chunk_size)) == expected
+        pieces = [expr[i:i + 5] for i in range(0, len(expr), 5)]
+        assert to_string(parse_stream(pieces, module)) == expected
+    for expr in ["((1 + 2)", "(1 + 2))", "(1 % 2)", "(1 + .)"]:
+        try:
+            parse_stream([expr[:3], expr[3:]], module)
+        except ParsingException as error:
+            print("Expression:", expr, "->", error.message)
+    ctx = module.Context()
+    ctx.bind("x", 2)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "expr.txt")
+        print("      input      depth   peak (MB)  read with")
+        for depth in [16, 18, 20]:  # size x4 each time, depth + 2
+            with open(path, "w") as file:
+                write_balanced(file, depth, random.Random(depth))
+            size = os.path.getsize(path)
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                tracemalloc.start()
+                value = parse_stream(buffer, Evaluating_builder(ctx))
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            print("%8.1f MB  %9d  %10.2f  mmap, values" % (size / 1e6, depth, peak / 1e6))
+            if depth == 16:
+                with open(path) as file:
+                    assert parse_expression(file.read(), module, Table_parser).eval(ctx) == value
+        for levels in [10 ** 4, 10 ** 5]:  # the stack grows with the depth
+            with open(path, "w") as file:
+                file.write("(" * levels + "x")
+                for _ in range(levels):
+                    file.write(" + 1)")
+            tracemalloc.start()
+            with open(path) as file:
+                value = parse_stream(file, Evaluating_builder(ctx))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert value == levels + 2
+            print("%8.1f MB  %9d  %10.2f  text file, values" % (os.path.getsize(path) / 1e6, levels, peak / 1e6))
+        with open(path, "w") as file:
+            write_balanced(file, 16, random.Random(16))
+
+        def whole_text() -> Any:
+            with open(path) as file:
+                return parse_expression(file.read(), module, Table_parser)
+
+        def stream() -> Any:
+            with open(path) as file:
+                return parse_stream(file, module)
+
+        for label, read in [("Table_parser, whole text", whole_text), ("Stream_parser, text file", stream)]:
+            tracemalloc.start()
+            read()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            t_read = best_time(read, repeat=1)
+            print("terms of %.1f MB: %s, peak %.1f MB, %.2f s" % (os.path.getsize(path) / 1e6, label, peak / 1e6,
+                                                                 t_read))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Operators and node kinds shared by the modules working on terms.
+
+The terms exist in two flavours: 'terms.py' uses strings ("+", "-", ...) for the
+operators and 'terms-enum.py' uses the enumerations Bin_op and Una_op.
+The functions of this module accept both flavours, thus the tools built on top
+of them (compilation, batch evaluation, ...) work with the terms of either module.
+
+The dictionaries BIN_OP_DICT, UNA_OP_DICT and FUNCTION_DICT are the registry of
+the operators: the nodes look up their operation once, when they are created.
+New operators are added with register_binary, register_unary and register_function.
+The built-in operators cannot be replaced: the compiler, the stack machine, the
+batch evaluation and the store inline them instead of reading the registry.
+"""
+
+import sys
+import math
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+# for enum support
+from enum import Enum, unique
+
+
+@unique
+class Kind(Enum):
+    """Enumeration of the kinds of nodes of a term"""
+    CONSTANT = 1
+    VARIABLE = 2
+    BINARY = 3
+    UNARY = 4
+    FUNCTION = 5
+
+
+# symbol of the operators of 'terms-enum.py', the key is the name of the enum member
+ENUM_SYMBOLS: Dict[str, str] = {"ADD": "+",
+                                "SUB": "-",
+                                "MUL": "*",
+                                "DIV": "/",
+                                "POW": "**",
+                                "MOD": "%",
+                                "MIN": "min",
+                                "MAX": "max",
+                                "NEG": "-",
+                                "SQRT": "sqrt",
+                                "EXP": "exp"
+                                }
+
+BIN_OP_DICT: Dict[str, Callable[[Any, Any], Any]] = {"+": lambda l, r: l + r,
+                                                     "-": lambda l, r: l - r,
+                                                     "*": lambda l, r: l * r,
+                                                     "/": lambda l, r: l / r,
+                                                     "**": lambda l, r: l ** r,
+                                                     "%": lambda l, r: l % r,
+                                                     "min": min,
+                                                     "max": max
+                                                     }
+
+UNA_OP_DICT: Dict[str, Callable[[Any], Any]] = {"-": lambda t: (-1) * t}
+
+# functions of n terms: name -> (function, number of arguments)
+FUNCTION_DICT: Dict[str, Tuple[Callable[..., Any], int]] = {"sqrt": (math.sqrt, 1),
+                                                            "exp": (math.exp, 1)
+                                                            }
+
+# the built-in operators and functions, they cannot be replaced
+BUILTIN_BIN_OPS: Set[str] = set(BIN_OP_DICT)
+BUILTIN_UNA_OPS: Set[str] = set(UNA_OP_DICT)
+BUILTIN_FUNCTIONS: Set[str] = set(FUNCTION_DICT)
+
+
+def check_not_builtin(name: str, builtins: Set[str]) -> None:
+    """
+    Checks that a registered symbol does not replace a built-in operator.
+    """
+    if name in builtins:
+        raise ValueError("the built-in operator '" + name + "' cannot be replaced")
+
+
+def register_binary(name: str, operation: Callable[[Any, Any], Any]) -> None:
+    """
+    Adds or replaces a binary operator, except a built-in one. The nodes already
+    created keep their operation.
+    :param name: symbol of the operator, used as bin_op
+    :param operation: function of the values of the left and right terms
+    """
+    check_not_builtin(name, BUILTIN_BIN_OPS)
+    BIN_OP_DICT[name] = operation
+
+
+def register_unary(name: str, operation: Callable[[Any], Any]) -> None:
+    """
+    Adds or replaces a unary operator, except a built-in one.
+    :param name: symbol of the operator, used as una_op
+    :param operation: function of the value of the term
+    """
+    check_not_builtin(name, BUILTIN_UNA_OPS)
+    UNA_OP_DICT[name] = operation
+
+
+def register_function(name: str, function: Callable[..., Any], arity: int) -> None:
+    """
+    Adds or replaces a function usable in a Function_expression, except a built-in one.
+    :param name: name of the function
+    :param function: function of the values of the terms
+    :param arity: number of arguments of the function
+    """
+    check_not_builtin(name, BUILTIN_FUNCTIONS)
+    FUNCTION_DICT[name] = (function, arity)
+
+
+def symbol(op: Any) -> str:
+    """
+    Converts an operator of any flavour into its symbol.
+    :param op: operator as a string ("+") or as an enum member (Bin_op.ADD)
+    :return: the symbol of the operator, e.g. "+"
+    """
+    if isinstance(op, str):
+        return op
+    return ENUM_SYMBOLS[op.name]
+
+
+def bin_op_of(module: ModuleType, op: str) -> Any:
+    """
+    :param module: 'terms' or 'terms-enum'
+    :param op: symbol of a binary operator, e.g. "+"
+    :return: the operator in the flavour of the module, "+" or Bin_op.ADD
+    """
+    if hasattr(module, "Bin_op"):
+        for member in module.Bin_op:
+            if symbol(member) == op:
+                return member
+    return op
+
+
+def una_op_of(module: ModuleType, op: str) -> Any:
+    """
+    :param module: 'terms' or 'terms-enum'
+    :param op: symbol of a unary operator, e.g. "-"
+    :return: the operator in the flavour of the module, "-" or Una_op.NEG
+    """
+    if hasattr(module, "Una_op"):
+        for member in module.Una_op:
+            if symbol(member) == op:
+                return member
+    return op
+
+
+def kind(term: Any) -> Kind:
+    """
+    Determines the kind of a node. The attributes are inspected rather than the
+    classes, thus the nodes of both 'terms.py' and 'terms-enum.py' are recognized.
+    :param term: node of a term
+    :return: the kind of the node
+    """
+    if hasattr(term, "bin_op"):
+        return Kind.BINARY
+    if hasattr(term, "una_op"):
+        return Kind.UNARY
+    if hasattr(term, "function"):
+        return Kind.FUNCTION
+    if hasattr(term, "name"):
+        return Kind.VARIABLE
+    return Kind.CONSTANT
+
+
+def module_of(term: Any) -> ModuleType:
+    """
+    Finds the module defining the classes of a node, used to create new nodes
+    of the same flavour.
+    :param term: node of a term
+    :return: the module 'terms' or 'terms-enum' (or '__main__' if run as a script)
+    """
+    return sys.modules[type(term).__module__]
+
+
+def to_string(term: Any) -> str:
+    """
+    Fully parenthesized representation of a term, e.g. ((3 + (-d)) * 5) or sqrt((x min 2))
+    :param term: term of any flavour
+    :return: the text of the term
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return str(term.value)
+    if node_kind == Kind.VARIABLE:
+        return term.name
+    if node_kind == Kind.UNARY:
+        return "(" + symbol(term.una_op) + to_string(term.term) + ")"
+    if node_kind == Kind.FUNCTION:
+        return symbol(term.function) + "(" + ", ".join(to_string(operand) for operand in term.terms) + ")"
+    return "(" + to_string(term.left) + " " + symbol(term.bin_op) + " " + to_string(term.right) + ")"
@@ -0,0 +1,75 @@
+"""
+Benchmark of the registry of terms_ops: the operations bound once, when the
+nodes are created, against the dictionaries of the operators built again at each
+evaluation of a node, as the terms did before the registry.
+"""
+
+import tracemalloc
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_ops import Kind, kind, symbol, to_string
+from terms_bench import load_flavours, operators, best_time
+
+
+def eval_rebuilding_dict(term: Any, context: Any) -> float:
+    """
+    Evaluation as the terms did before the registry: the dictionary of the
+    operators is built again at each evaluation of a node. Kept for the benchmark.
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.BINARY:
+        value_left = eval_rebuilding_dict(term.left, context)
+        value_right = eval_rebuilding_dict(term.right, context)
+        bin_op_dict = {"+": lambda l, r: l + r,
+                       "-": lambda l, r: l - r,
+                       "*": lambda l, r: l * r,
+                       "/": lambda l, r: l / r
+                       }
+        return bin_op_dict[symbol(term.bin_op)](value_left, value_right)
+    if node_kind == Kind.UNARY:
+        value_term = eval_rebuilding_dict(term.term, context)
+        una_op_dict = {"-": lambda t: (-1) * t}
+        return una_op_dict[symbol(term.una_op)](value_term)
+    return term.eval(context)
+
+
+def allocated_bytes(function: Callable[[], Any], number: int = 1000) -> int:
+    """
+    Measures the memory allocated by a function with tracemalloc: the peak of the
+    traced memory during the calls, above the memory traced before the calls.
+    tracemalloc must be started.
+    :return: the peak in bytes, the loop itself allocates a few bytes too
+    """
+    function()  # first call out of the measure: caches, lazy attributes, ...
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(number):
+        function()
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+def main() -> None:
+    """ Launcher: allocations and time of eval with the operations bound at construction """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        bin_ops, neg = operators(module)
+        ctx = module.Context()
+        ctx.bind("d", 2)  # all the intermediate values are small cached integers
+        term = module.Binary_expression(module.Binary_expression(module.Constant(3),
+                                                                 module.Unary_expression(module.Variable("d"), neg),
+                                                                 bin_ops[0]),
+                                        module.Constant(5), bin_ops[2])
+        assert term.eval(ctx) == eval_rebuilding_dict(term, ctx)
+        tracemalloc.start()
+        empty = allocated_bytes(lambda: None)
+        bound = allocated_bytes(lambda: term.eval(ctx))
+        rebuilt = allocated_bytes(lambda: eval_rebuilding_dict(term, ctx))
+        tracemalloc.stop()
+        print("peak bytes above an empty loop: %d with bound operations, %d rebuilding the dictionaries"
+              % (bound - empty, rebuilt - empty))
+        print("eval of %s: %.2f us" % (to_string(term), best_time(lambda: term.eval(ctx), number=20000) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Optimizer of terms: constant folding and algebraic simplification.
+
+The term is rewritten bottom-up into a smaller equivalent term:
+  - constant folding:       3 + 5        ->  8
+                            -(4)         ->  -4
+                            sqrt(4)      ->  2.0
+  - double negation:        -(-x)        ->  x
+  - canonical order of the commutative operators + and *, the constants
+    go to the right:        3 + x        ->  x + 3
+  - identities:             x + 0, x - 0, x * 1, x / 1  ->  x
+                            x * 0        ->  0
+
+'specialize' substitutes the variables of a partial context by their values
+before simplifying: the residual term depends only on the free variables.
+
+An operation raising an exception (division by zero, sqrt(-1), ...) is never
+folded, thus evaluating the optimized term still raises ZeroDivisionError or
+ValueError. For the same reason x * 0 is simplified only if x cannot raise an
+exception. This simplification assumes finite values: inf * 0 gives nan and not 0.
+'specialize' does not make this assumption, the free variables may be bound to
+inf or nan, thus it keeps x * 0 and the residual term gives the same values.
+"""
+
+import zlib
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, module_of, to_string, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_bench import load_flavours, operators, random_leaf, random_term, count_nodes, best_time
+
+COMMUTATIVE: Set[str] = {"+", "*"}
+
+# operators which never raise an exception
+SAFE_BIN_OPS: Set[str] = {"+", "-", "*", "min", "max"}
+
+# rank of the kinds in the canonical order, the constants are the last ones
+KIND_RANK: Dict[Kind, int] = {Kind.VARIABLE: 0, Kind.UNARY: 1, Kind.BINARY: 2, Kind.FUNCTION: 2, Kind.CONSTANT: 3}
+
+
+def is_constant(term: Any, value: Optional[float] = None) -> bool:
+    """
+    :param value: if given, the constant must also have this value
+    :return: True if the term is a constant (of the given value)
+    """
+    return kind(term) == Kind.CONSTANT and (value is None or term.value == value)
+
+
+def may_raise(term: Any) -> bool:
+    """
+    :return: True if the evaluation of the term may raise an exception, e.g. ZeroDivisionError
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.BINARY:
+        return symbol(term.bin_op) not in SAFE_BIN_OPS or may_raise(term.left) or may_raise(term.right)
+    if node_kind == Kind.UNARY:
+        return symbol(term.una_op) != "-" or may_raise(term.term)
+    return node_kind == Kind.FUNCTION
+
+
+def fold(module: ModuleType, operation: Callable[..., Any], operands: List[Any]) -> Optional[Any]:
+    """
+    Computes the value of an operator applied to constants.
+    :return: the constant, or None if the operation raises an exception (it is left for eval)
+    """
+    try:
+        return module.Constant(operation(*[operand.value for operand in operands]))
+    except (ArithmeticError, ValueError):
+        return None
+
+
+def canonical_key(term: Any, keys: Dict[int, Tuple[Any, Tuple[int, str, int]]]) -> Tuple[int, str, int]:
+    """
+    Key of the canonical order of the operands of a commutative operator: the rank
+    of the kind, the name, value or operator of the node and a digest of the keys
+    of its operands. The digest only depends on the term (the hash of the integers
+    is not randomized), the keys are computed once per node.
+    :param keys: cache id of a node -> (node, key), the node is kept alive thus its id is not reused
+    :return: the key of the term
+    """
+    cached = keys.get(id(term))
+    if cached is not None:
+        return cached[1]
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        label, operands = repr(term.value), []
+    elif node_kind == Kind.VARIABLE:
+        label, operands = term.name, []
+    elif node_kind == Kind.UNARY:
+        label, operands = symbol(term.una_op), [term.term]
+    elif node_kind == Kind.FUNCTION:
+        label, operands = symbol(term.function), term.terms
+    else:
+        label, operands = symbol(term.bin_op), [term.left, term.right]
+    digest = hash((zlib.crc32(label.encode()),) + tuple(canonical_key(operand, keys)[2] for operand in operands))
+    key = (KIND_RANK[node_kind], label, digest)
+    keys[id(term)] = (term, key)
+    return key
+
+
+def optimize(term: Any, finite: bool = True) -> Any:
+    """
+    Simplifies a term of 'terms.py' or 'terms-enum.py'. The given term is not
+    modified, the unchanged subterms are shared with the result.
+    :param term: the term to simplify
+    :param finite: True if the variables are bound to finite values only, x * 0 is then simplified into 0
+    :return: an equivalent term with at most the same number of nodes
+    """
+    return simplify(term, {}, finite)
+
+
+def simplify(term: Any, keys: Dict[int, Tuple[Any, Tuple[int, str, int]]], finite: bool) -> Any:
+    """
+    Simplifies a term bottom-up, see optimize.
+    :param keys: cache of the canonical keys of the simplified subterms
+    :param finite: True if x * 0 can be simplified into 0
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT or node_kind == Kind.VARIABLE:
+        return term
+    module = module_of(term)
+    if node_kind == Kind.UNARY:
+        operand = simplify(term.term, keys, finite)
+        folded = fold(module, UNA_OP_DICT[symbol(term.una_op)], [operand]) if is_constant(operand) else None
+        if folded is not None:
+            return folded
+        if kind(operand) == Kind.UNARY and symbol(operand.una_op) == "-" and symbol(term.una_op) == "-":
+            return operand.term
+        if operand is term.term:
+            return term
+        return module.Unary_expression(operand, term.una_op)
+    if node_kind == Kind.FUNCTION:
+        operands = [simplify(operand, keys, finite) for operand in term.terms]
+        if all(is_constant(operand) for operand in operands):
+            folded = fold(module, FUNCTION_DICT[symbol(term.function)][0], operands)
+            if folded is not None:
+                return folded
+        if all(operand is original for operand, original in zip(operands, term.terms)):
+            return term
+        return module.Function_expression(operands, term.function)
+
+    left = simplify(term.left, keys, finite)
+    right = simplify(term.right, keys, finite)
+    op = symbol(term.bin_op)
+    if is_constant(left) and is_constant(right):
+        folded = fold(module, BIN_OP_DICT[op], [left, right])
+        if folded is not None:
+            return folded
+    if op in COMMUTATIVE and canonical_key(right, keys) < canonical_key(left, keys):
+        left, right = right, left
+    if (op == "+" or op == "-") and is_constant(right, 0):
+        return left
+    if (op == "*" or op == "/") and is_constant(right, 1):
+        return left
+    if op == "*" and is_constant(right, 0) and finite and not may_raise(left):
+        return right
+    if left is term.left and right is term.right:
+        return term
+    return module.Binary_expression(left, right, term.bin_op)
+
+
+def substitute(term: Any, bindings: Dict[str, Any]) -> Any:
+    """
+    Replaces the variables bound in a dictionary by constants. The given term is
+    not modified, the unchanged subterms are shared with the result.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param bindings: dictionary (name of variable, value)
+    :return: the term with the constants
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return term
+    if node_kind == Kind.VARIABLE:
+        return module_of(term).Constant(bindings[term.name]) if term.name in bindings else term
+    module = module_of(term)
+    if node_kind == Kind.UNARY:
+        operand = substitute(term.term, bindings)
+        return term if operand is term.term else module.Unary_expression(operand, term.una_op)
+    if node_kind == Kind.FUNCTION:
+        operands = [substitute(operand, bindings) for operand in term.terms]
+        if all(operand is original for operand, original in zip(operands, term.terms)):
+            return term
+        return module.Function_expression(operands, term.function)
+    left = substitute(term.left, bindings)
+    right = substitute(term.right, bindings)
+    if left is term.left and right is term.right:
+        return term
+    return module.Binary_expression(left, right, term.bin_op)
+
+
+def specialize(term: Any, partial_context: Any) -> Any:
+    """
+    Partial evaluation of a term: the variables bound in the partial context are
+    replaced by their value and the term is simplified. Evaluating the residual
+    term in a context gives the same value as evaluating the term in the same
+    context completed with the bindings of the partial context, also when the
+    free variables are bound to inf or nan.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param partial_context: context binding some of the variables of the term
+    :return: the residual term, whose variables are the free variables of the term
+    """
+    return optimize(substitute(term, partial_context.lookup_table), finite=False)
+
+
+def redundant_term(module: ModuleType, depth: int, rng: random.Random) -> Any:
+    """
+    Builds a random term full of constant subterms, identities and double negations.
+    :return: the root of the term
+    """
+    bin_ops, neg = operators(module)
+    if depth == 0:
+        return random_leaf(module, ["x"], rng)
+    left = redundant_term(module, depth - 1, rng)
+    choice = rng.random()
+    if choice < 0.2:
+        return module.Unary_expression(module.Unary_expression(left, neg), neg)
+    if choice < 0.4:
+        return module.Binary_expression(module.Constant(rng.choice([0, 1])), left, rng.choice(bin_ops))
+    right = redundant_term(module, depth - 1, rng) if depth > 3 else module.Constant(rng.randint(1, 9))
+    return module.Binary_expression(left, right, rng.choice(bin_ops))
+
+
+def main() -> None:
+    """ Launcher: number of nodes and eval throughput before and after optimization """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        bin_ops, neg = operators(module)
+        ctx = module.Context()
+        ctx.bind("x", 1.25)
+        rng = random.Random(5)
+        terms = [redundant_term(module, 7, rng) for _ in range(50)]
+        optimized = [optimize(term) for term in terms]
+        for term, simplified in zip(terms, optimized):
+            assert term.eval(ctx) == simplified.eval(ctx)
+        nodes = sum(count_nodes(term) for term in terms)
+        nodes_optimized = sum(count_nodes(term) for term in optimized)
+        print("nodes: %d before, %d after" % (nodes, nodes_optimized))
+        t_before = best_time(lambda: [term.eval(ctx) for term in terms], number=20)
+        t_after = best_time(lambda: [term.eval(ctx) for term in optimized], number=20)
+        print("evaluations per second: %.0f before, %.0f after (%.1fx)" % (len(terms) / t_before,
+                                                                          len(terms) / t_after, t_before / t_after))
+        example = module.Binary_expression(module.Binary_expression(module.Constant(3), module.Constant(5), bin_ops[0]),
+                                           module.Unary_expression(module.Unary_expression(module.Variable("x"), neg), neg),
+                                           bin_ops[2])
+        print(to_string(example), "->", to_string(optimize(example)))
+
+        names = ["x" + str(i) for i in range(50)]
+        term = random_term(module, 200, names, random.Random(2))
+        full = module.Context()
+        partial = module.Context()
+        for name in names:
+            value = random.Random(name).randint(-5, 5)
+            full.bind(name, value)
+            if name not in names[:5]:
+                partial.bind(name, value)
+        residual = specialize(term, partial)
+        free = module.Context()
+        rng = random.Random(3)
+        for _ in range(100):
+            for name in names[:5]:
+                value = rng.randint(-5, 5)
+                full.bind(name, value)
+                free.bind(name, value)
+            assert term.eval(full) == residual.eval(free)
+        t_term = best_time(lambda: term.eval(full), number=200)
+        t_residual = best_time(lambda: residual.eval(free), number=200)
+        print("specialized on 45 of 50 variables: %d nodes -> %d nodes, eval %.1f us -> %.1f us"
+              % (count_nodes(term), count_nodes(residual), t_term * 1e6, t_residual * 1e6))
+        product = module.Binary_expression(module.Variable("x"), module.Variable("y"), bin_ops[2])
+        partial = module.Context()
+        partial.bind("y", 0)
+        free = module.Context()
+        free.bind("x", float("inf"))
+        print(to_string(product), "with y = 0 ->", to_string(specialize(product, partial)), "=",
+              specialize(product, partial).eval(free), "for x = inf")
+
+
+if __name__ == "__main__":
+    main()
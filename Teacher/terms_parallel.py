@@ -0,0 +1,225 @@
+"""
+Evaluation of many terms against many contexts with a pool of processes.
+
+The method 'eval' is pure Python, thus it uses only one core. 'evaluate_many'
+distributes the terms over several processes:
+  - the terms are written once in the compact format of terms_store, every
+    process maps the same file in memory (nothing is pickled per term);
+  - the values of the contexts are copied once into a block of shared memory
+    (multiprocessing.shared_memory), a matrix with one row per context and one
+    column per variable, read by all the processes without copy;
+  - the processes evaluate chunks of terms, each term once for all the contexts:
+    one NumPy operation per node on the columns of values (see terms_batch),
+    and the results are streamed back in the order of the terms.
+
+    for values in evaluate_many(terms, contexts, workers=4):
+        ...  # values[j] is the value of the term against contexts[j]
+
+The NumPy operations raise FloatingPointError instead of giving inf or nan
+(division by zero, overflow, sqrt(-1), ...). The term is then evaluated again
+context by context with the operations of Python, as 'eval' does: x / 0 raises
+ZeroDivisionError, 1e200 * 1e200 gives inf. The constants and the values of the
+variables are stored as floats (see terms_store), thus the results are always
+floats: they are equal to those of 'eval' as long as the integers are exact in a
+float, 2 ** 70 is exact with 'eval' and rounded here.
+
+Storing the terms costs about as much as evaluating each term for 20 contexts
+with 'eval', thus one process is not faster for a few contexts. Measures of the
+launcher (2000 terms of 55 nodes, one process):
+
+    contexts   serial eval   evaluate_many, 1 process
+          20        0.55 s     0.78 s (0.7x), of which 0.57 s to store the terms
+         200        7.60 s     1.05 s (7.2x)
+"""
+
+import os
+import sys
+import random
+import tempfile
+import multiprocessing
+from multiprocessing import shared_memory
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable, Iterator
+import numpy as np
+from terms_ops import bin_op_of, FUNCTION_DICT
+from terms_vm import Opcode, BIN_OPCODES
+from terms_batch import apply, BIN_OP_UFUNC, FUNCTION_UFUNC
+from terms_store import write_corpus, Corpus_file
+from terms_bench import load_flavours, random_term, best_time
+
+# NumPy function of each binary opcode of terms_store, indexed by the value of the opcode
+BIN_UFUNCS_BY_CODE: Dict[int, Callable[[Any, Any], Any]] = {BIN_OPCODES[name].value: ufunc
+                                                            for name, ufunc in BIN_OP_UFUNC.items()}
+
+# state of a worker process, set by start_worker
+worker: Dict[str, Any] = {}
+
+
+def start_worker(store_path: str, memory_name: str, contexts: int, names: List[str]) -> None:
+    """
+    Initializer of the processes of the pool: maps the terms and the columns of the shared values.
+    """
+    worker["corpus"] = Corpus_file(store_path)
+    worker["memory"] = shared_memory.SharedMemory(name=memory_name)
+    matrix = np.ndarray((len(names), contexts), dtype=np.float64, buffer=worker["memory"].buf)
+    worker["columns"] = {name: matrix[column] for column, name in enumerate(names)}
+    worker["rows"] = contexts
+
+
+def evaluate_columns(corpus: Corpus_file, index: int, columns: Dict[str, np.ndarray]) -> Any:
+    """
+    Evaluates a term of the corpus for all the contexts at once: one NumPy operation
+    per node, on the column of values of every context (see terms_batch).
+    :param corpus: the mapped terms
+    :param index: number of the term in the corpus
+    :param columns: name of variable -> values of the variable, one per context
+    :return: array of the values of the term, or a scalar if the term has no variable
+    """
+    start = corpus.roots[index - 1] + 1 if index > 0 else 0
+    opcodes, arguments, rights, constants, names = corpus.opcodes, corpus.arguments, corpus.rights, \
+        corpus.constants, corpus.names
+    const, var, neg, call = Opcode.CONST.value, Opcode.VAR.value, Opcode.NEG.value, Opcode.CALL.value
+    values: List[Any] = []
+    for node in range(start, corpus.roots[index] + 1):
+        opcode = opcodes[node]
+        if opcode == const:
+            values.append(constants[arguments[node]])
+        elif opcode == var:
+            values.append(columns[names[arguments[node]]])
+        elif opcode == neg:
+            values.append(np.negative(values[arguments[node] - start]))
+        elif opcode == call:
+            function = names[rights[node]]
+            values.append(apply(FUNCTION_UFUNC, function, FUNCTION_DICT[function][0],
+                                [values[arguments[node] - start]]))
+        else:
+            values.append(BIN_UFUNCS_BY_CODE[opcode](values[arguments[node] - start], values[rights[node] - start]))
+    return values[-1]
+
+
+class Row_context:
+    """
+    Context reading the values of the variables of one context in the columns,
+    as Python floats.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], row: int) -> None:
+        self.columns = columns
+        self.row = row
+
+    def get_value(self, name: str) -> float:
+        return float(self.columns[name][self.row])
+
+
+def evaluate_chunk(indices: range) -> List[List[float]]:
+    """
+    Evaluates some terms of the corpus against all the contexts. A term whose
+    columns give inf or nan is evaluated again context by context, as eval does.
+    :param indices: numbers of the terms in the corpus
+    :return: for each term the list of its values, one per context
+    """
+    corpus, columns, rows = worker["corpus"], worker["columns"], worker["rows"]
+    results = []
+    with np.errstate(all="raise", under="ignore"):
+        for index in indices:
+            try:
+                results.append(np.broadcast_to(evaluate_columns(corpus, index, columns), (rows,)).tolist())
+            except FloatingPointError:  # eval may raise an exception or give inf or nan
+                results.append([corpus.eval(index, Row_context(columns, row)) for row in range(rows)])
+    return results
+
+
+def check_bindings(corpus: Corpus_file, contexts: List[Any]) -> List[str]:
+    """
+    Checks in advance that the variables of the terms are bound in every context,
+    an unbound variable is reported like Context.get_value does.
+    :param corpus: the stored terms
+    :return: the names of the variables of the terms
+    """
+    opcodes = np.asarray(corpus.opcodes)
+    variables = np.unique(np.asarray(corpus.arguments)[opcodes == Opcode.VAR.value])
+    names = [corpus.names[variable] for variable in variables.tolist()]
+    for context in contexts:
+        for name in names:
+            if name not in context.lookup_table:
+                print("The variable '" + name + "' is not bound to a value")
+                sys.exit()
+    return names
+
+
+def evaluate_many(terms: List[Any], contexts: List[Any], workers: int = 0,
+                  chunk_size: int = 64) -> Iterator[List[float]]:
+    """
+    Evaluates every term against every context with a pool of processes.
+    :param terms: terms of 'terms.py' or 'terms-enum.py'
+    :param contexts: contexts with a lookup_table (name of variable, value)
+    :param workers: number of processes, all the cores if 0
+    :param chunk_size: number of terms sent at once to a process
+    :return: iterator giving for each term (in order) the list of its values, one per context
+    """
+    directory = tempfile.TemporaryDirectory()
+    try:
+        store_path = os.path.join(directory.name, "terms.terms")
+        write_corpus(terms, store_path)
+        corpus = Corpus_file(store_path)
+        names = check_bindings(corpus, contexts)
+        corpus.close()
+        memory = shared_memory.SharedMemory(create=True, size=max(1, len(contexts) * len(names) * 8))
+        try:
+            matrix = np.ndarray((len(names), len(contexts)), dtype=np.float64, buffer=memory.buf)
+            for column, name in enumerate(names):
+                matrix[column] = [context.lookup_table[name] for context in contexts]
+            del matrix  # the shared memory can be closed only without views
+            chunks = [range(start, min(start + chunk_size, len(terms)))
+                      for start in range(0, len(terms), chunk_size)]
+            with multiprocessing.Pool(workers or os.cpu_count(), initializer=start_worker,
+                                      initargs=(store_path, memory.name, len(contexts), names)) as pool:
+                for results in pool.imap(evaluate_chunk, chunks):
+                    yield from results
+        finally:
+            memory.close()
+            memory.unlink()
+    finally:
+        directory.cleanup()
+
+
+def main() -> None:
+    """ Launcher: scaling of evaluate_many with the number of processes and of contexts """
+    names = ["x" + str(i) for i in range(1000)]
+    module = load_flavours()[0]
+    rng = random.Random(10)
+    terms = [random_term(module, 20, names, rng) for _ in range(2000)]
+    with tempfile.TemporaryDirectory() as directory:
+        t_store = best_time(lambda: write_corpus(terms, os.path.join(directory, "terms.terms")), repeat=1)
+    print("%d terms, written in the store in %.2f s (part of each evaluate_many)" % (len(terms), t_store))
+    for count in [20, 200]:
+        contexts = []
+        for _ in range(count):
+            ctx = module.Context()
+            for name in names:
+                ctx.bind(name, rng.uniform(-1, 1))
+            contexts.append(ctx)
+        serial = [[term.eval(ctx) for ctx in contexts] for term in terms]
+        t_serial = best_time(lambda: [[term.eval(ctx) for ctx in contexts] for term in terms], repeat=1)
+        print("%d contexts, serial eval: %.2f s" % (len(contexts), t_serial))
+        for workers in range(1, (os.cpu_count() or 1) + 1):
+            assert list(evaluate_many(terms, contexts, workers)) == serial
+            t_pool = best_time(lambda: list(evaluate_many(terms, contexts, workers)), repeat=1)
+            print("%2d processes: %.2f s (%.1fx)" % (workers, t_pool, t_serial / t_pool))
+    ctx = module.Context()  # the same values and exceptions as eval
+    ctx.bind("x", float("inf"))
+    ctx.bind("y", 0)
+    inverse = module.Binary_expression(module.Constant(1), module.Variable("x"), bin_op_of(module, "/"))
+    difference = module.Binary_expression(module.Variable("x"), module.Variable("x"), bin_op_of(module, "-"))
+    print("1 / x, x - x for x = inf:", list(evaluate_many([inverse, difference], [ctx])))
+    try:
+        list(evaluate_many([module.Binary_expression(module.Constant(1), module.Variable("y"),
+                                                     bin_op_of(module, "/"))], [ctx]))
+        assert False, "1 / 0 must raise ZeroDivisionError"
+    except ZeroDivisionError as error:
+        print("1 / y for y = 0: ZeroDivisionError", error)
+
+
+if __name__ == "__main__":
+    main()
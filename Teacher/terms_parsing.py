@@ -0,0 +1,381 @@
+"""
+Parser of arithmetic expressions translated into terms.
+
+Same grammar as the parser of Tutorial/17-terms_parsing.py, composed of
+constants only and all the parenthesis, i.e. no precedence between the
+operators. Example:  ((((3+5)-3)*(4+4))/(2*4))
+
+Instead of printing the tokens, 'parse' builds the term of the expression with
+the classes of a module, 'terms' or 'terms-enum', thus the evaluation is done by
+invoking the 'eval' method:
+
+    term = parse_expression("((3+5)*2)", terms)
+    term.eval(terms.Context())
+
+'Table_parser' has the same grammar with a table-driven lexer: the class of each
+character is found in a table, the numbers may have several digits and a
+decimal part, the identifiers are variables and the whitespace is skipped:
+
+    term = parse_expression("((rate * 12.5) + offset)", terms, Table_parser)
+
+'Iterative_parser' parses the same grammar as 'Parser' without recursion, thus an
+expression nested 10^6 levels deep does not raise a RecursionError.
+'Iterative_table_parser' does the same with the lexer of Table_parser.
+"""
+
+import re
+import time
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+# for enum support
+from enum import Enum, unique
+from terms_ops import bin_op_of, to_string
+from terms_vm import lower
+from terms_bench import load_flavours, best_time
+
+
+class ParsingException(Exception):
+    """Exception raised if error are discovered during parsing"""
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+
+
+@unique
+class Token(Enum):
+    "Enumeration of the various tokens in an arithmetic expression"
+    CTE = 0  # constant 0,1,2,...,9
+    ADD = 1  # binary operators
+    SUB = 2
+    MUL = 3
+    DIV = 4
+    PARL = 5  # left parenthesis
+    PARR = 6  # right parenthesis
+    ERR = 7  # something else -> error
+    END = 8  # all token have been read
+    VAR = 9  # identifier, name of a variable
+
+
+# symbol of the binary operators
+TOKEN_SYMBOLS: Dict[Token, str] = {Token.ADD: "+", Token.SUB: "-", Token.MUL: "*", Token.DIV: "/"}
+
+
+class Parser:
+    """
+    Parser of arithmetic expressions defined by the following grammar (for the sake of simplicity):
+
+       expression := constant
+                   | ( expression )
+                   | ( expression operator expression )
+         operator := + - * /
+         constant := 0 | 1 | 2 | ... | 8 | 9
+
+    examples of arithmetic expresssions:
+       ((2+(4*5))-(9/3))
+       (2*5)
+       ((2*5))
+       (4)
+       7
+    """
+
+    def __init__(self, expr: str, module: ModuleType) -> None:
+        """
+        Initialises the expression to parse.
+        :param: expr: the expression to parse
+        :param module: 'terms' or 'terms-enum', the classes of the built terms
+        """
+        self.expr = expr
+        self.module = module
+        self.bin_ops = {token: bin_op_of(module, op) for token, op in TOKEN_SYMBOLS.items()}
+        self.length = len(self.expr)
+        self.idx = 0  # index used by next_token()
+        self.current = self.next_token()  # reads first token
+
+    def next_token(self) -> Tuple[Token, float]:
+        """
+        Determines the next token in the expression and returns a tuple composed of the
+           [0] the token itself (enum)
+           [1] the value (float) used only in case of constant
+        :return: tuple with the read token and a value if token is a constant
+        """
+        if self.idx == self.length: return (Token.END, 0)  # everything has been read, value not used (=0)
+        if self.expr[self.idx] == '0':
+            res = (Token.CTE, 0)  # constant
+        elif self.expr[self.idx] == '1':
+            res = (Token.CTE, 1)
+        elif self.expr[self.idx] == '2':
+            res = (Token.CTE, 2)
+        elif self.expr[self.idx] == '3':
+            res = (Token.CTE, 3)
+        elif self.expr[self.idx] == '4':
+            res = (Token.CTE, 4)
+        elif self.expr[self.idx] == '5':
+            res = (Token.CTE, 5)
+        elif self.expr[self.idx] == '6':
+            res = (Token.CTE, 6)
+        elif self.expr[self.idx] == '7':
+            res = (Token.CTE, 7)
+        elif self.expr[self.idx] == '8':
+            res = (Token.CTE, 8)
+        elif self.expr[self.idx] == '9':
+            res = (Token.CTE, 9)
+        elif self.expr[self.idx] == '+':
+            res = (Token.ADD, 0)  # operator, value not used
+        elif self.expr[self.idx] == '-':
+            res = (Token.SUB, 0)
+        elif self.expr[self.idx] == '*':
+            res = (Token.MUL, 0)
+        elif self.expr[self.idx] == '/':
+            res = (Token.DIV, 0)
+        elif self.expr[self.idx] == '(':
+            res = (Token.PARL, 0)
+        elif self.expr[self.idx] == ')':
+            res = (Token.PARR, 0)
+        else:
+            return (Token.ERR, 0)  # something else -> error
+        self.idx += 1  # increment idx for next time
+        return res
+
+    def parse(self) -> Any:
+        """
+        Recursive function to parse an arithmetic expression.
+        :return: the term of the expression
+        """
+        if self.current[0] == Token.CTE:  # constant ?
+            term = self.module.Constant(self.current[1])
+            self.current = self.next_token()  # reads next token
+            return term  # recursion end
+        elif self.current[0] == Token.VAR:  # variable ?
+            term = self.module.Variable(self.current[1])
+            self.current = self.next_token()  # reads next token
+            return term  # recursion end
+        elif self.current[0] == Token.PARL:  # ( ?
+            self.current = self.next_token()  # reads next token
+            left = self.parse()  # recursion for ( expr )
+            if self.current[0] == Token.PARR:  # ) ?
+                self.current = self.next_token()  # reads next token
+                return left  # recursion end
+            if self.current[0] in self.bin_ops:  # operator?
+                bin_op = self.bin_ops[self.current[0]]
+            else:
+                raise ParsingException("Wrong operator or left parenthesis expected")
+            self.current = self.next_token()  # reads next token
+            right = self.parse()  # recursion for ( ... oper expr )
+            if self.current[0] == Token.PARR:  # ) ?
+                self.current = self.next_token()  # reads next token
+                return self.module.Binary_expression(left, right, bin_op)  # recursion end
+            else:
+                raise ParsingException("Right parenthesis expected")
+        else:
+            raise ParsingException("Left parenthesis or constant expected")
+
+
+# classes of the characters for the lexer of Table_parser, the other characters are errors
+SINGLE, DIGIT, LETTER, SPACE = 0, 1, 2, 3
+CHAR_CLASSES: Dict[str, int] = {}
+CHAR_CLASSES.update(dict.fromkeys("+-*/()", SINGLE))
+CHAR_CLASSES.update(dict.fromkeys("0123456789.", DIGIT))
+CHAR_CLASSES.update(dict.fromkeys("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_", LETTER))
+CHAR_CLASSES.update(dict.fromkeys(" \t\r\n", SPACE))
+# tokens of the characters of class SINGLE
+SINGLE_TOKENS: Dict[str, Token] = {"+": Token.ADD, "-": Token.SUB, "*": Token.MUL, "/": Token.DIV,
+                                   "(": Token.PARL, ")": Token.PARR}
+NUMBER = re.compile(r"[0-9]+(?:\.[0-9]*)?|\.[0-9]+")
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z_0-9]*")
+
+
+class Table_parser(Parser):
+    """
+    Parser of the grammar of 'Parser' extended by its lexer:
+
+         constant := digits | digits . digits | . digits     (int if there is no decimal point)
+         variable := identifier, e.g. x, rate_2
+
+    and whitespace between the tokens. The class of a character is read in the
+    table CHAR_CLASSES instead of a test per possible character.
+    """
+
+    def next_token(self) -> Tuple[Token, Any]:
+        """
+        Determines the next token in the expression, the whitespace is skipped.
+        :return: tuple with the read token and its value: number for a constant, name for a variable
+        """
+        expr = self.expr
+        idx = self.idx
+        while idx < self.length:
+            char = expr[idx]
+            char_class = CHAR_CLASSES.get(char)
+            if char_class == SINGLE:
+                self.idx = idx + 1
+                return (SINGLE_TOKENS[char], 0)
+            if char_class == SPACE:
+                idx += 1
+            elif char_class == DIGIT:
+                match = NUMBER.match(expr, idx)
+                if match is None:  # a point alone
+                    break
+                self.idx = match.end()
+                text = match.group()
+                return (Token.CTE, float(text) if "." in text else int(text))
+            elif char_class == LETTER:
+                match = IDENTIFIER.match(expr, idx)
+                self.idx = match.end()
+                return (Token.VAR, match.group())
+            else:
+                break
+        self.idx = idx
+        if idx == self.length:
+            return (Token.END, 0)
+        return (Token.ERR, 0)  # something else -> error
+
+
+class Iterative_parser(Parser):
+    """
+    Parser of the grammar of 'Parser' with an explicit stack instead of the
+    recursion: the depth of the expression is only limited by the memory. The
+    terms built and the ParsingException raised are the same as with 'Parser'.
+    The lexer of Table_parser is used by Iterative_table_parser.
+    """
+
+    def parse(self) -> Any:
+        """
+        Parses an arithmetic expression, each open parenthesis pushes a frame on a stack:
+           None          waiting for the left expression after (
+           (left, op)    waiting for the right expression after ( left op
+        :return: the term of the expression
+        """
+        stack: List[Optional[Tuple[Any, Any]]] = []
+        while True:
+            token, value = self.current  # start of an expression
+            if token == Token.CTE:  # constant ?
+                term = self.module.Constant(value)
+            elif token == Token.VAR:  # variable ?
+                term = self.module.Variable(value)
+            elif token == Token.PARL:  # ( ?
+                self.current = self.next_token()  # reads next token
+                stack.append(None)
+                continue
+            else:
+                raise ParsingException("Left parenthesis or constant expected")
+            self.current = self.next_token()  # reads next token
+            while stack:  # the expression 'term' is complete, it ends the frames it can
+                frame = stack.pop()
+                if frame is None:  # ( term
+                    if self.current[0] == Token.PARR:  # ) ?
+                        self.current = self.next_token()  # reads next token
+                        continue
+                    if self.current[0] in self.bin_ops:  # operator?
+                        stack.append((term, self.bin_ops[self.current[0]]))
+                        self.current = self.next_token()  # reads next token
+                        break  # next: the right expression
+                    raise ParsingException("Wrong operator or left parenthesis expected")
+                if self.current[0] != Token.PARR:  # ( left op term ) ?
+                    raise ParsingException("Right parenthesis expected")
+                self.current = self.next_token()  # reads next token
+                term = self.module.Binary_expression(frame[0], term, frame[1])
+            else:
+                return term
+
+
+class Iterative_table_parser(Iterative_parser, Table_parser):
+    """
+    Parser without recursion with the lexer of Table_parser: numbers with several
+    digits and a decimal part, variables and whitespace.
+    """
+
+
+def parse_expression(expr: str, module: ModuleType, parser_class: Callable[[str, ModuleType], Parser] = Parser) -> Any:
+    """
+    Parses a whole expression, all the tokens must be read.
+    :param expr: the expression to parse
+    :param module: 'terms' or 'terms-enum', the classes of the built term
+    :param parser_class: Parser, Table_parser for numbers, variables and whitespace,
+                         Iterative_parser for deep expressions, or Iterative_table_parser for both
+    :return: the term of the expression
+    """
+    parser = parser_class(expr, module)
+    term = parser.parse()
+    if parser.current[0] != Token.END:
+        raise ParsingException("Parenthesis not balanced")
+    return term
+
+
+def random_expression(depth: int, rng: random.Random) -> str:
+    """
+    :return: a random expression of the grammar of the parser with at most the given depth
+    """
+    if depth == 0 or rng.random() < 0.2:
+        return str(rng.randint(0, 9))
+    return "(" + random_expression(depth - 1, rng) + rng.choice("+-*") + random_expression(depth - 1, rng) + ")"
+
+
+def count_tokens(parser: Parser) -> int:
+    """
+    Reads all the tokens of a parser.
+    :return: the number of tokens read
+    """
+    count = 0
+    while parser.current[0] != Token.END and parser.current[0] != Token.ERR:
+        parser.current = parser.next_token()
+        count += 1
+    return count
+
+
+def main() -> None:
+    """ Launcher """
+    for module in load_flavours():
+        expr = "((((3+5)-3)*(4+4))/(2*4))"
+        print("Expression:", expr, "=", parse_expression(expr, module).eval(module.Context()))
+        for expr in ["(((3)+(5))*(4)))", "((3+5)", "(3%5)", "(3+)"]:
+            try:
+                parse_expression(expr, module)
+            except ParsingException as error:
+                print("Expression:", expr, "->", error.message)
+        corpus = [random_expression(8, random.Random(i)) for i in range(1000)]
+        t_parse = best_time(lambda: [parse_expression(expr, module) for expr in corpus], repeat=3)
+        print("%s: %.0f expressions per second" % (module.__name__, len(corpus) / t_parse))
+        expr = "((rate * 12.5) + (offset / .5))"
+        ctx = module.Context()
+        ctx.bind("rate", 2)
+        ctx.bind("offset", 3)
+        print("Expression:", expr, "=", parse_expression(expr, module, Table_parser).eval(ctx))
+    module = load_flavours()[0]
+    text = "".join(random_expression(8, random.Random(i)) for i in range(2000))  # long input, single digits
+    spaced = text.replace("(", "( 12.5 * rate_1 + ").replace("+", " + ").replace(")", " )")
+    print("lexer         characters  tokens per second")
+    for parser_class, source in [(Parser, text), (Table_parser, text), (Table_parser, spaced)]:
+        count = count_tokens(parser_class(source, module))
+        t_tokens = best_time(lambda: count_tokens(parser_class(source, module)), repeat=3)
+        print("%12s  %10d  %17.0f" % (parser_class.__name__, len(source), count / t_tokens))
+    rng = random.Random(7)
+    for expr in [random_expression(10, rng) for _ in range(2000)]:  # same terms and same errors
+        position = rng.randrange(len(expr))
+        for case in [expr, expr[:position] + rng.choice("()+-*/%7") + expr[position + 1:], expr[:position]]:
+            outcomes = []
+            for parser_class in [Parser, Iterative_parser]:
+                try:
+                    outcomes.append(to_string(parse_expression(case, module, parser_class)))
+                except ParsingException as error:
+                    outcomes.append(error.message)
+            assert outcomes[0] == outcomes[1], (case, outcomes)
+    try:
+        parse_expression("(" * 10000 + "1" + "+1)" * 10000, module)
+    except RecursionError:
+        print("Parser: RecursionError at 10000 levels")
+    print("    levels  Iterative_parser (s)  us per level")
+    for levels in [10 ** 4, 10 ** 5, 10 ** 6]:
+        expr = "(" * levels + "1" + "+1)" * levels  # ((((1+1)+1)+1)...+1)
+        start = time.perf_counter()
+        term = parse_expression(expr, module, Iterative_parser)
+        seconds = time.perf_counter() - start
+        assert lower(term).run(module.Context()) == levels + 1
+        print("%10d  %20.3f  %12.3f" % (levels, seconds, seconds / levels * 1e6))
+    expr = "(" * levels + "1+(" * levels + "2" + ")" * 2 * levels  # ((((1+(1+(...2)))))
+    assert lower(parse_expression(expr, module, Iterative_parser)).run(module.Context()) == levels + 2
+
+
+if __name__ == "__main__":
+    main()
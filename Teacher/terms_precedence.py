@@ -0,0 +1,192 @@
+"""
+Parser of arithmetic expressions with the usual precedence of the operators.
+
+The grammar of terms_parsing needs all the parenthesis: ((3+(4*x))-1). The
+parser of this module builds the term of an expression written as usual,
+3 + 4*x - 1, in a single pass by precedence climbing (Pratt parser):
+
+    * and / bind tighter than + and -, all of them are left associative:
+        a - b - c  is  (a - b) - c
+    the unary minus binds tighter than all of them:
+        -a * b  is  (-a) * b
+    the parenthesis are still accepted: (3 + 4) * x
+
+The tokens are read by the lexer of Table_parser (terms_parsing): numbers with
+several digits and a decimal part, variables and whitespace.
+
+    term = parse_infix("3 + 4*x - 1", terms)
+    to_infix(term)                          # '3 + 4 * x - 1', only the needed parenthesis
+"""
+
+import math
+import random
+from decimal import Decimal
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, to_string, una_op_of
+from terms_parsing import ParsingException, Token, Table_parser
+from terms_bench import load_flavours, random_term, best_time
+
+# binding power of the binary operators, the higher binds tighter
+BINDING_POWERS: Dict[Token, int] = {Token.ADD: 1, Token.SUB: 1, Token.MUL: 2, Token.DIV: 2}
+# binding power of the symbols of the operators, used to print the terms
+SYMBOL_POWERS: Dict[str, int] = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+class Precedence_parser(Table_parser):
+    """
+    Parser of arithmetic expressions defined by the following grammar:
+
+       expression := expression operator expression     (see BINDING_POWERS)
+                   | - expression
+                   | ( expression )
+                   | constant
+                   | variable
+         operator := + - * /
+    """
+
+    def __init__(self, expr: str, module: ModuleType) -> None:
+        """
+        Initialises the expression to parse.
+        :param: expr: the expression to parse
+        :param module: 'terms' or 'terms-enum', the classes of the built terms
+        """
+        super().__init__(expr, module)
+        self.una_op = una_op_of(module, "-")
+
+    def parse(self, min_power: int = 0) -> Any:
+        """
+        Parses an expression whose binary operators bind tighter than min_power.
+        :param min_power: binding power of the operator at the left of the expression, 0 for none
+        :return: the term of the expression
+        """
+        left = self.parse_prefix()
+        while True:
+            token = self.current[0]
+            power = BINDING_POWERS.get(token, 0)
+            if power <= min_power:  # not an operator, or it belongs to the caller
+                return left
+            self.current = self.next_token()  # reads next token
+            right = self.parse(power)  # the same power: left associative
+            left = self.module.Binary_expression(left, right, self.bin_ops[token])
+
+    def parse_prefix(self) -> Any:
+        """
+        Parses a constant, a variable, a negated operand or an expression between parenthesis.
+        :return: the term of the operand
+        """
+        token, value = self.current
+        if token == Token.CTE:  # constant ?
+            self.current = self.next_token()  # reads next token
+            return self.module.Constant(value)
+        if token == Token.VAR:  # variable ?
+            self.current = self.next_token()  # reads next token
+            return self.module.Variable(value)
+        if token == Token.SUB:  # unary minus ?
+            self.current = self.next_token()  # reads next token
+            return self.module.Unary_expression(self.parse_prefix(), self.una_op)
+        if token == Token.PARL:  # ( ?
+            self.current = self.next_token()  # reads next token
+            term = self.parse()
+            if self.current[0] != Token.PARR:  # ) ?
+                raise ParsingException("Right parenthesis expected")
+            self.current = self.next_token()  # reads next token
+            return term
+        raise ParsingException("Left parenthesis, constant or variable expected")
+
+
+def parse_infix(expr: str, module: ModuleType) -> Any:
+    """
+    Parses a whole expression written with the precedence of the operators.
+    :param expr: the expression to parse
+    :param module: 'terms' or 'terms-enum', the classes of the built term
+    :return: the term of the expression
+    """
+    parser = Precedence_parser(expr, module)
+    term = parser.parse()
+    if parser.current[0] == Token.PARR:
+        raise ParsingException("Parenthesis not balanced")
+    if parser.current[0] != Token.END:
+        raise ParsingException("Operator expected")
+    return term
+
+
+def constant_to_infix(value: Any) -> str:
+    """
+    Writes a constant as the lexer reads it: the lexer has no exponent and no
+    negative number, thus a float is written with all its digits and a negative
+    constant as the negation of its absolute value, between parenthesis.
+    :param value: an int or a finite float
+    :return: the text of the constant, e.g. '3', '0.00001' or '(-2.5)'
+    """
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError("the constant " + repr(value) + " cannot be written as a number")
+        text = format(Decimal(repr(abs(value))), "f")  # the digits of repr, without exponent
+        if "." not in text:
+            text += ".0"  # read back as a float
+    else:
+        text = str(abs(value))
+    return "(-" + text + ")" if math.copysign(1, value) < 0 else text
+
+
+def to_infix(term: Any) -> str:
+    """
+    Representation of a term with only the needed parenthesis, read back by parse_infix.
+    A negative constant is read back as the negation of a constant, with the same value.
+    :param term: term with the operators + - * / and the unary minus
+    :return: the text of the term
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return constant_to_infix(term.value)
+    if node_kind == Kind.VARIABLE:
+        return term.name
+    if node_kind == Kind.UNARY:
+        operand = to_infix(term.term)
+        return "-" + (operand if kind(term.term) != Kind.BINARY else "(" + operand + ")")
+    op = symbol(term.bin_op)
+    power = SYMBOL_POWERS[op]
+    left = to_infix(term.left)
+    right = to_infix(term.right)
+    if kind(term.left) == Kind.BINARY and SYMBOL_POWERS[symbol(term.left.bin_op)] < power:
+        left = "(" + left + ")"
+    if kind(term.right) == Kind.BINARY and SYMBOL_POWERS[symbol(term.right.bin_op)] <= power:
+        right = "(" + right + ")"  # a - (b - c) is not a - b - c
+    return left + " " + op + " " + right
+
+
+def main() -> None:
+    """ Launcher: examples and expressions per second on a corpus of 1M expressions """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        ctx = module.Context()
+        ctx.bind("x", 2)
+        for expr in ["3 + 4*x - 1", "2 * (3 + 4) / x", "-x * 10 - -2.5", "12 - 3 - 4"]:
+            term = parse_infix(expr, module)
+            print("Expression:", expr, "->", to_string(term), "=", term.eval(ctx))
+        for expr in ["(3 + 4", "3 + 4)", "3 4", "3 + * 4", "3 % 4"]:
+            try:
+                parse_infix(expr, module)
+            except ParsingException as error:
+                print("Expression:", expr, "->", error.message)
+    module = load_flavours()[0]
+    rng = random.Random(5)
+    terms = [random_term(module, rng.randint(1, 12), ["x", "y", "rate"], rng) for _ in range(10000)]
+    for term in terms:  # round trip: the same tree
+        assert to_string(parse_infix(to_infix(term), module)) == to_string(term)
+    infix = [to_infix(term) for term in terms] * 100  # 1M expressions
+    parenthesized = [to_string(term) for term in terms] * 100
+    print("%d expressions, %.1f characters on average with the precedence, %.1f fully parenthesized"
+          % (len(infix), sum(map(len, infix)) / len(infix), sum(map(len, parenthesized)) / len(parenthesized)))
+    t_infix = best_time(lambda: [parse_infix(expr, module) for expr in infix], repeat=1)
+    print("Precedence_parser: %.0f expressions per second" % (len(infix) / t_infix))
+    sample = parenthesized[:100000]
+    t_parenthesized = best_time(lambda: [parse_infix(expr, module) for expr in sample], repeat=1)
+    print("Precedence_parser, fully parenthesized: %.0f expressions per second" % (len(sample) / t_parenthesized))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Profiler of the evaluation of terms: time spent in each node.
+
+While a profiler is enabled, the methods 'eval' of the classes Constant, Variable,
+Unary_expression, Binary_expression and Function_expression are replaced by
+wrappers that count the evaluations of each node and measure their cumulative time. Disabling the profiler
+puts the original methods back, thus a disabled profiler costs nothing: 'eval' is
+exactly the method written in the module. Only one profiler can be enabled at a
+time on a module.
+
+    with Profiler(terms) as profiler:
+        term.eval(ctx)
+    print(profiler.report())
+    open("terms.folded", "w").write(profiler.folded())
+
+The folded report has one line per path of nodes from the root, e.g.
+"*;+;-;d 12", with the time in microseconds spent in the last node itself.
+This is the input format of flame graph tools (flamegraph.pl, speedscope, ...).
+"""
+
+import time
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, to_string
+from terms_bench import load_flavours, random_term, best_time
+
+CLASSES = ["Constant", "Variable", "Unary_expression", "Binary_expression", "Function_expression"]
+
+# name of module -> the profiler enabled on its classes, at most one at a time
+ENABLED: Dict[str, "Profiler"] = {}
+
+
+def label(term: Any) -> str:
+    """
+    :return: short name of a node in the reports: its value, name or operator
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        return str(term.value)
+    if node_kind == Kind.VARIABLE:
+        return term.name
+    if node_kind == Kind.UNARY:
+        return symbol(term.una_op)
+    if node_kind == Kind.FUNCTION:
+        return symbol(term.function)
+    return symbol(term.bin_op)
+
+
+class Node_statistics:
+    """
+    Number of evaluations and cumulative time of a node.
+    """
+
+    def __init__(self, term: Any) -> None:
+        self.term = term
+        self.count = 0
+        self.time = 0  # nanoseconds, including the operands
+
+
+class Profiler:
+    """
+    Records the evaluations of the nodes of the terms of a module while enabled.
+    """
+
+    def __init__(self, module: ModuleType) -> None:
+        """
+        :param module: 'terms' or 'terms-enum', the module whose classes are instrumented
+        """
+        self.module = module
+        self.originals: Dict[str, Callable[..., Any]] = {}  # name of class -> original eval
+        self.nodes: Dict[int, Node_statistics] = {}  # identity of node -> statistics
+        self.paths: Dict[Tuple[str, ...], int] = {}  # path of labels -> self time in nanoseconds
+        self.stack: List[str] = []  # labels of the nodes being evaluated
+        self.children: List[int] = [0]  # time of the operands of the nodes being evaluated
+
+    def __enter__(self) -> "Profiler":
+        self.enable()
+        return self
+
+    def __exit__(self, *exception: Any) -> None:
+        self.disable()
+
+    def enable(self) -> None:
+        """
+        Replaces the methods eval of the classes by the instrumented wrappers. Only one
+        profiler can be enabled on a module, otherwise disabling them in another order
+        would put back the wrapper of the other one instead of the original methods.
+        """
+        enabled = ENABLED.setdefault(self.module.__name__, self)
+        if enabled is not self:
+            raise ValueError("another profiler is enabled on the module '" + self.module.__name__ + "'")
+        for name in CLASSES:
+            cls = getattr(self.module, name, None)
+            if cls is not None and name not in self.originals:
+                self.originals[name] = cls.eval
+                cls.eval = self.wrap(cls.eval)
+
+    def disable(self) -> None:
+        """
+        Puts the original methods eval back.
+        """
+        for name, original in self.originals.items():
+            setattr(getattr(self.module, name), "eval", original)
+        self.originals = {}
+        if ENABLED.get(self.module.__name__) is self:
+            del ENABLED[self.module.__name__]
+
+    def wrap(self, original: Callable[[Any, Any], float]) -> Callable[[Any, Any], float]:
+        """
+        :param original: the method eval of a class
+        :return: the method eval recording the statistics of each node
+        """
+        profiler = self
+
+        def eval(term: Any, context: Any) -> float:
+            profiler.stack.append(label(term))
+            profiler.children.append(0)
+            start = time.perf_counter_ns()
+            try:
+                return original(term, context)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                children = profiler.children.pop()
+                path = tuple(profiler.stack)
+                profiler.stack.pop()
+                profiler.children[-1] += elapsed
+                profiler.paths[path] = profiler.paths.get(path, 0) + elapsed - children
+                statistics = profiler.nodes.get(id(term))
+                if statistics is None:
+                    statistics = profiler.nodes[id(term)] = Node_statistics(term)
+                statistics.count += 1
+                statistics.time += elapsed
+
+        return eval
+
+    def report(self, limit: int = 10) -> str:
+        """
+        :param limit: maximal number of nodes in the report
+        :return: the nodes with the largest cumulative time, one per line
+        """
+        lines = ["     count   time (us)  node"]
+        ranking = sorted(self.nodes.values(), key=lambda statistics: statistics.time, reverse=True)
+        for statistics in ranking[:limit]:
+            text = to_string(statistics.term)
+            lines.append("%10d %11.1f  %s" % (statistics.count, statistics.time / 1000,
+                                              text if len(text) < 60 else text[:57] + "..."))
+        return "\n".join(lines)
+
+    def folded(self) -> str:
+        """
+        :return: the self time (microseconds) of each path of nodes in the folded format of flame graphs
+        """
+        return "\n".join(";".join(path) + " " + str(round(self_time / 1000))
+                         for path, self_time in self.paths.items()) + "\n"
+
+
+def main() -> None:
+    """ Launcher: example of report and cost of a disabled profiler """
+    module = load_flavours()[0]
+    names = ["a", "b", "c", "d"]
+    ctx = module.Context()
+    for name in names:
+        ctx.bind(name, random.Random(name).uniform(-2, 2))
+    term = random_term(module, 20, names)
+    t_before = best_time(lambda: term.eval(ctx), number=2000)
+    with Profiler(module) as profiler:
+        for _ in range(100):
+            term.eval(ctx)
+        t_enabled = best_time(lambda: term.eval(ctx), number=200)
+    t_disabled = best_time(lambda: term.eval(ctx), number=2000)
+    print(profiler.report(5))
+    print("folded report:", len(profiler.folded().splitlines()), "paths, first one:",
+          profiler.folded().splitlines()[0])
+    print("eval: %.2f us before, %.2f us disabled, %.2f us enabled" % (t_before * 1e6, t_disabled * 1e6,
+                                                                      t_enabled * 1e6))
+
+
+if __name__ == "__main__":
+    main()
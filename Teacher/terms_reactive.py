@@ -0,0 +1,253 @@
+"""
+Incremental re-evaluation of a term when the bindings of the context change.
+
+Each node of the term is mirrored by a cell which caches the last value of the
+node and knows the variables the node depends on. When a variable is bound to a
+new value, the context notifies the reactive terms: only the cells on the paths
+from the leaves of this variable up to the root are marked dirty. The next
+evaluation recomputes the dirty cells and reuses the cached values of the others.
+
+    ctx = Reactive_context()
+    ctx.bind("a", 1)
+    ctx.bind("b", 2)
+    reactive = Reactive_term(term, ctx)
+    reactive.eval()                    # first evaluation: every node is computed
+    ctx.bind("a", 3)
+    reactive.eval()                    # only the nodes depending on 'a' are computed
+    reactive.recomputed                # number of nodes computed by the last eval
+
+The context keeps weak references to the reactive terms: a term no longer used
+is not notified any more. 'close' unregisters a term at once.
+"""
+
+import sys
+import random
+import weakref
+from operator import attrgetter
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_ops import Kind, kind, symbol, bin_op_of, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_bench import load_flavours, random_term, best_time
+
+
+def same_value(old: Any, new: Any) -> bool:
+    """
+    :return: True if the values are equal, of the same type and with the same sign if zero
+    """
+    return old == new and type(old) == type(new) and (old != 0 or str(old) == str(new))
+
+
+class Reactive_context:
+    """
+    Same lookup table as the Context of the terms, but the reactive terms
+    registered in the context are notified when a variable is bound.
+    """
+
+    def __init__(self) -> None:
+        "Just create an empty dictionary and no observer"
+        self.lookup_table: Dict[str, float] = {}
+        self.observers: "weakref.WeakSet[Reactive_term]" = weakref.WeakSet()
+
+    def bind(self, name: str, value: float) -> None:
+        """
+        Creates or changes the value of a variable and notifies the reactive terms
+        if the value is different (0.0 and -0.0 are different values).
+        :param name: name of the variable
+        :param value: value to assign to the variable
+        """
+        if not name:  # is name empty
+            print("The variable's name is empty")
+            sys.exit()
+        unchanged = name in self.lookup_table and same_value(self.lookup_table[name], value)
+        self.lookup_table[name] = value  # create entry and/or change value
+        if unchanged:
+            return
+        for observer in list(self.observers):
+            observer.invalidate(name)
+
+    def get_value(self, name: str) -> float:
+        if not name:  # name is empty
+            print("The variable's name is empty")
+            sys.exit()
+        if name in self.lookup_table:
+            return self.lookup_table[name]
+        else:
+            print("The variable '" + name + "' is not bound to a value")
+            sys.exit()
+
+
+class Cell:
+    """
+    Mirror of a node of a term: caches its value and links to its parents. The
+    kind of the node and its operation are resolved once, when the cell is built.
+    """
+
+    def __init__(self, term: Any, children: List["Cell"], node_kind: Kind, argument: Any) -> None:
+        """
+        :param term: the mirrored node
+        :param children: cells of the operands of the node
+        :param node_kind: the kind of the node
+        :param argument: the value of a constant, the name of a variable or the operation of an operator
+        """
+        self.term = term
+        self.children = children
+        self.kind = node_kind
+        self.argument = argument
+        self.index = 0  # position in the order of construction, given by Reactive_term.build
+        self.parents: List[Cell] = []
+        self.dirty = True  # the value must be computed
+        self.value: Any = None
+        self.variables: Set[str] = set()  # variables the node depends on
+        for child in children:
+            child.parents.append(self)
+            self.variables |= child.variables
+
+
+CELL_INDEX = attrgetter("index")
+
+
+class Reactive_term:
+    """
+    Term whose evaluation recomputes only the nodes affected by the bindings
+    changed since the previous evaluation.
+    """
+
+    def __init__(self, term: Any, context: Reactive_context) -> None:
+        """
+        Builds the cells of the term and registers it in the context.
+        :param term: term of 'terms.py' or 'terms-enum.py'
+        :param context: the context the term is evaluated in
+        """
+        self.context = context
+        self.leaves: Dict[str, List[Cell]] = {}  # name of variable -> cells of the variable
+        self.count = 0  # number of cells
+        self.pending: List[Cell] = []  # the dirty cells, all of them before the first eval
+        self.recomputed = 0  # number of cells computed by the last eval
+        self.root = self.build(term)
+        context.observers.add(self)
+
+    def close(self) -> None:
+        """
+        Unregisters the term from its context, it is not notified any more.
+        """
+        self.context.observers.discard(self)
+
+    def build(self, term: Any) -> Cell:
+        """
+        :return: the cell of a node, the cells of its children are built first
+        """
+        node_kind = kind(term)
+        if node_kind == Kind.CONSTANT:
+            cell = Cell(term, [], node_kind, term.value)
+        elif node_kind == Kind.VARIABLE:
+            cell = Cell(term, [], node_kind, term.name)
+            cell.variables.add(term.name)
+            self.leaves.setdefault(term.name, []).append(cell)
+        elif node_kind == Kind.UNARY:
+            cell = Cell(term, [self.build(term.term)], node_kind, UNA_OP_DICT[symbol(term.una_op)])
+        elif node_kind == Kind.FUNCTION:
+            cell = Cell(term, [self.build(operand) for operand in term.terms], node_kind,
+                        FUNCTION_DICT[symbol(term.function)][0])
+        else:
+            cell = Cell(term, [self.build(term.left), self.build(term.right)], node_kind,
+                        BIN_OP_DICT[symbol(term.bin_op)])
+        cell.index = self.count  # the children have smaller indices
+        self.count += 1
+        self.pending.append(cell)
+        return cell
+
+    def invalidate(self, name: str) -> None:
+        """
+        Marks dirty the cells depending on a variable. The propagation stops at
+        the cells already dirty since their ancestors are dirty too.
+        :param name: name of the variable bound to a new value
+        """
+        todo = list(self.leaves.get(name, []))
+        while todo:
+            cell = todo.pop()
+            if not cell.dirty:
+                cell.dirty = True
+                self.pending.append(cell)
+                todo.extend(cell.parents)
+
+    def eval(self) -> float:
+        """
+        Evaluates the term in its context: the dirty cells are computed in the
+        order of their indices, thus the children of a cell are computed before it.
+        The counter 'recomputed' gives the number of nodes computed by this evaluation.
+        If an operation raises an exception, the cells not computed yet stay pending.
+        :return: the value of the term
+        """
+        pending = self.pending
+        self.pending = []
+        pending.sort(key=CELL_INDEX)
+        get_value = self.context.get_value
+        try:
+            for cell in pending:
+                node_kind = cell.kind
+                if node_kind is Kind.BINARY:
+                    left, right = cell.children
+                    cell.value = cell.argument(left.value, right.value)
+                elif node_kind is Kind.VARIABLE:
+                    cell.value = get_value(cell.argument)
+                elif node_kind is Kind.CONSTANT:
+                    cell.value = cell.argument
+                else:  # unary operator or function
+                    cell.value = cell.argument(*[child.value for child in cell.children])
+                cell.dirty = False
+        except Exception:
+            self.pending = [cell for cell in pending if cell.dirty] + self.pending
+            raise
+        self.recomputed = len(pending)
+        return self.root.value
+
+
+def main() -> None:
+    """ Launcher: nodes recomputed and time of the incremental evaluation """
+    names = ["x" + str(i) for i in range(50)]
+    for module in load_flavours():
+        print("Module", module.__name__)
+        term = random_term(module, 300, names, random.Random(7))
+        ctx = Reactive_context()
+        for name in names:
+            ctx.bind(name, random.Random(name).uniform(-1, 1))
+        reactive = Reactive_term(term, ctx)
+        reactive.eval()
+        print("full evaluation: %d nodes computed out of %d" % (reactive.recomputed, reactive.count))
+        rng = random.Random(0)
+        recomputed = 0
+        rounds = 200
+        for _ in range(rounds):
+            ctx.bind(rng.choice(names), rng.uniform(-1, 1))
+            assert reactive.eval() == term.eval(ctx)
+            recomputed += reactive.recomputed
+        print("after binding one variable: %.1f nodes computed on average" % (recomputed / rounds))
+
+        plain = module.Context()  # the full evaluation does not pay the notifications
+        for name in names:
+            plain.bind(name, ctx.get_value(name))
+
+        def rebind_and_eval(context: Any, evaluate: Callable[[], float]) -> None:
+            context.bind(rng.choice(names), rng.uniform(-1, 1))
+            evaluate()
+
+        t_full = best_time(lambda: rebind_and_eval(plain, lambda: term.eval(plain)), number=100)
+        t_incremental = best_time(lambda: rebind_and_eval(ctx, reactive.eval), number=100)
+        print("bind + eval: full %.1f us, incremental %.1f us" % (t_full * 1e6, t_incremental * 1e6))
+
+        ctx.bind("x", 0)  # an exception does not lose the cells still to compute
+        quotient = Reactive_term(module.Binary_expression(module.Constant(3), module.Variable("x"),
+                                                          bin_op_of(module, "/")), ctx)
+        try:
+            quotient.eval()
+            assert False, "3 / 0 must raise ZeroDivisionError"
+        except ZeroDivisionError:
+            pass
+        ctx.bind("x", 2)
+        assert quotient.eval() == 1.5
+        print("3 / x: ZeroDivisionError for x = 0, then", quotient.eval(), "for x = 2")
+
+
+if __name__ == "__main__":
+    main()
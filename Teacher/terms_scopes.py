@@ -0,0 +1,168 @@
+"""
+Layered contexts: a scope holds only the bindings it overrides and falls back
+to its parent for the other variables.
+
+A request which changes a few variables of a big shared context does not copy
+the whole lookup table any more, it creates a child scope in O(1):
+
+    base = terms.Context()                  # or a Scope_context
+    ...                                     # bind a million variables
+    scope = Scope_context(base)             # nothing is copied
+    scope.bind("d", 8)                      # written in the scope only (copy on write)
+    term.eval(scope)                        # 'd' is found in the scope, the others in base
+
+A scope keeps the tuple of the tables of its chain, from itself to the root,
+thus a lookup is one dict.get per layer and no call to the parents. Through a
+long chain of scopes the lookups become slower; 'flatten' merges the bindings
+of the ancestors of the scope, except the root, into a single layer: the chain
+has then only three tables (the scope, the merged layer and the root) and the
+cost is the number of overrides, not the size of the root. The root is still
+shared, thus binding a variable in the root is seen by all the scopes, whereas
+a flattened scope keeps the values that the intermediate scopes had when it was
+flattened. The scopes created before from the flattened scope keep their chain.
+"""
+
+import sys
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_bench import load_flavours, random_term, best_time
+
+UNBOUND = object()  # default of dict.get, distinct from any value
+
+
+class Scope_context:
+    """
+    Context whose lookup table holds only the overrides of the scope, the other
+    variables are looked up in the parent.
+    """
+
+    def __init__(self, parent: Optional[Any] = None, max_depth: Optional[int] = None) -> None:
+        """
+        Creates an empty scope, the parent is neither copied nor modified.
+        :param parent: a Context of 'terms.py' or 'terms-enum.py', another Scope_context or None
+        :param max_depth: if given, the scope is flattened when its chain has more layers
+        """
+        self.parent = parent
+        self.overrides: Dict[str, float] = {}
+        parent_tables = () if parent is None else getattr(parent, "tables", (parent.lookup_table,))
+        self.ancestors: Tuple[Dict[str, float], ...] = parent_tables
+        self.tables: Tuple[Dict[str, float], ...] = (self.overrides,) + parent_tables
+        if max_depth is not None and len(self.tables) > max_depth:
+            self.flatten()
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: the number of tables searched by a lookup
+        """
+        return len(self.tables)
+
+    def child(self) -> "Scope_context":
+        """
+        :return: a new empty scope whose parent is this scope
+        """
+        return Scope_context(self)
+
+    def bind(self, name: str, value: float) -> None:
+        """
+        Creates or changes the value of a variable in this scope only, the parent
+        keeps its value.
+        :param name: name of the variable
+        :param value: value to assign to the variable
+        """
+        if not name:  # is name empty
+            print("The variable's name is empty")
+            sys.exit()
+        self.overrides[name] = value
+
+    def get_value(self, name: str) -> float:
+        value = self.overrides.get(name, UNBOUND)
+        if value is not UNBOUND:
+            return value
+        for table in self.ancestors:  # from the parent to the root
+            value = table.get(name, UNBOUND)
+            if value is not UNBOUND:
+                return value
+        if not name:  # name is empty, checked only when the lookup fails
+            print("The variable's name is empty")
+            sys.exit()
+        print("The variable '" + name + "' is not bound to a value")
+        sys.exit()
+
+    def flatten(self) -> None:
+        """
+        Merges the overrides of the ancestors of this scope, except the root, into a
+        new layer between this scope and the root. The overrides of this scope are
+        not modified, thus the scopes already created from this scope still see the
+        bindings done later in this scope and in its former ancestors.
+        """
+        if len(self.tables) <= 3:
+            return
+        merged: Dict[str, float] = {}
+        for table in reversed(self.tables[1:-1]):  # the nearest scope wins
+            merged.update(table)
+        self.ancestors = (merged,) + self.tables[-1:]
+        self.tables = (self.overrides,) + self.ancestors
+
+    @property
+    def lookup_table(self) -> Dict[str, float]:
+        """
+        :return: a copy of all the bindings visible from this scope as a dictionary (name of variable, value)
+        """
+        bindings: Dict[str, float] = {}
+        for table in reversed(self.tables):
+            bindings.update(table)
+        return bindings
+
+
+def main() -> None:
+    """ Launcher: cost of a request overriding a few variables of a big context """
+    module = load_flavours()[0]
+    print(" bindings  copy dict (us)  new scope (us)  eval base  depth 2  depth 8  flattened (us)")
+    for count in [10000, 100000, 1000000]:
+        names = ["x" + str(i) for i in range(count)]
+        base = module.Context()
+        for i, name in enumerate(names):
+            base.bind(name, i % 7 - 3)
+        rng = random.Random(count)
+        used = rng.sample(names, 20)
+        term = random_term(module, 100, used, rng)
+        overrides = {name: 1.5 for name in used[:3]}
+
+        def copy_request() -> Any:
+            ctx = module.Context()
+            ctx.lookup_table = dict(base.lookup_table)
+            for name, value in overrides.items():
+                ctx.bind(name, value)
+            return ctx
+
+        def scope_request() -> Scope_context:
+            scope = Scope_context(base)
+            for name, value in overrides.items():
+                scope.bind(name, value)
+            return scope
+
+        assert term.eval(copy_request()) == term.eval(scope_request())
+        t_copy = best_time(copy_request, repeat=3)
+        t_scope = best_time(scope_request, number=1000)
+        scope = scope_request()
+        deep = scope
+        for _ in range(6):
+            deep = deep.child()
+        flattened = deep.child()
+        flattened.flatten()
+        assert deep.depth == 8 and flattened.depth == 3
+        assert term.eval(deep) == term.eval(flattened) == term.eval(scope)
+        t_base = best_time(lambda: term.eval(base), number=200)
+        t_depth2 = best_time(lambda: term.eval(scope), number=200)
+        t_depth8 = best_time(lambda: term.eval(deep), number=200)
+        t_flat = best_time(lambda: term.eval(flattened), number=200)
+        print("%9d  %14.1f  %14.2f  %9.1f  %7.1f  %7.1f  %14.1f" % (count, t_copy * 1e6, t_scope * 1e6,
+                                                                t_base * 1e6, t_depth2 * 1e6,
+                                                                t_depth8 * 1e6, t_flat * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Context backed by slots: the variables are numbered once and their values are
+stored in a list, indexed by the number of the variable.
+
+The usual Context does for each Variable.eval an emptiness check, a test 'in'
+and a second dictionary lookup. With 'Slot_context' the names are resolved once
+to integer slots by 'bind_slots', which translates the term into a tree of
+closures. Afterwards rebinding a variable (set_slot) and evaluating the term are
+only index operations in the list:
+
+    ctx = Slot_context()
+    ctx.bind("d", 7)
+    evaluate = bind_slots(term, ctx)
+    ctx.set_slot(ctx.slot("d"), 8)
+    evaluate(ctx.values)
+
+The methods bind and get_value still work, thus a Slot_context can also be
+given to the method 'eval' of the terms, the values are kept as they are bound
+(an int stays an int). This gains nothing: get_value still looks up the name,
+the launcher shows eval with a Slot_context as fast as or slower than with a
+Context. Only the closures of bind_slots avoid the lookups. Its lookup_table
+is a read-only view of the slots which sees the later bindings, thus it can be
+the parent of a Scope_context (terms_scopes).
+"""
+
+import sys
+import random
+from collections.abc import Mapping
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable, Iterator
+from terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_bench import load_flavours, random_term, count_nodes, best_time
+
+
+class Slot_table(Mapping):
+    """
+    Read-only view of the bindings of a Slot_context as a mapping (name of
+    variable, value). The view is live: it sees the later bindings of the context.
+    """
+
+    def __init__(self, slots: Dict[str, int], values: List[float]) -> None:
+        self.slots = slots
+        self.values = values
+
+    def __getitem__(self, name: str) -> float:
+        return self.values[self.slots[name]]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        slot = self.slots.get(name)
+        return default if slot is None else self.values[slot]
+
+    def __contains__(self, name: Any) -> bool:
+        return name in self.slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.slots)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+
+class Slot_context:
+    """
+    Stores the values of the variables into a list, each variable has a slot
+    (index in the list) given when the variable is bound for the first time.
+    """
+
+    def __init__(self) -> None:
+        "Just create an empty list of values and an empty table of slots"
+        self.values: List[float] = []
+        self.slots: Dict[str, int] = {}  # name of variable -> index in values
+        self.lookup_table = Slot_table(self.slots, self.values)  # read-only, sees the later bindings
+
+    def bind(self, name: str, value: float) -> None:
+        """
+        If the variable, called name, has no slot yet then a new slot is added,
+        otherwise the value in the slot of the variable is changed.
+        :param name: name of the variable
+        :param value: value to assign to the variable
+        """
+        if not name:  # is name empty
+            print("The variable's name is empty")
+            sys.exit()
+        if name in self.slots:
+            self.values[self.slots[name]] = value
+        else:
+            self.slots[name] = len(self.values)
+            self.values.append(value)
+
+    def get_value(self, name: str) -> float:
+        if not name:  # name is empty
+            print("The variable's name is empty")
+            sys.exit()
+        if name in self.slots:
+            return self.values[self.slots[name]]
+        else:
+            print("The variable '" + name + "' is not bound to a value")
+            sys.exit()
+
+    def slot(self, name: str) -> int:
+        """
+        :param name: name of a bound variable
+        :return: the index of the variable in the list values
+        """
+        if name in self.slots:
+            return self.slots[name]
+        print("The variable '" + name + "' is not bound to a value")
+        sys.exit()
+
+    def set_slot(self, slot: int, value: float) -> None:
+        """
+        Changes the value of a variable given by its slot.
+        :param slot: index given by the method slot
+        :param value: value to assign to the variable
+        """
+        self.values[slot] = value
+
+
+def bind_slots(term: Any, context: Slot_context) -> Callable[[List[float]], float]:
+    """
+    Translates a term into closures where the variables are replaced by their slot.
+    All the variables of the term must be bound in the context.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param context: context giving the slots of the variables
+    :return: function taking the list of values (context.values) and returning the value of the term
+    """
+    node_kind = kind(term)
+    if node_kind == Kind.CONSTANT:
+        value = term.value
+        return lambda values: value
+    if node_kind == Kind.VARIABLE:
+        slot = context.slot(term.name)
+        return lambda values: values[slot]
+    if node_kind == Kind.UNARY:
+        una_operation = UNA_OP_DICT[symbol(term.una_op)]
+        operand = bind_slots(term.term, context)
+        return lambda values: una_operation(operand(values))
+    if node_kind == Kind.FUNCTION:
+        function = FUNCTION_DICT[symbol(term.function)][0]
+        operands = [bind_slots(operand, context) for operand in term.terms]
+        if len(operands) == 1:
+            single = operands[0]
+            return lambda values: function(single(values))
+        return lambda values: function(*[operand(values) for operand in operands])
+    bin_operation = BIN_OP_DICT[symbol(term.bin_op)]
+    left = bind_slots(term.left, context)
+    right = bind_slots(term.right, context)
+    return lambda values: bin_operation(left(values), right(values))
+
+
+def main() -> None:
+    """ Launcher: benchmark of the dictionary context against the slot context """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        print("variables  nodes  eval dict (us)  eval slots (us)  bound slots (us)")
+        for count in [10, 30, 100]:
+            names = ["x" + str(i) for i in range(count)]
+            term = random_term(module, 2 * count, names, random.Random(count))
+            ctx = module.Context()
+            slot_ctx = Slot_context()
+            for name in names:
+                value = random.Random(name).uniform(-1, 1)
+                ctx.bind(name, value)
+                slot_ctx.bind(name, value)
+            evaluate = bind_slots(term, slot_ctx)
+            assert term.eval(ctx) == term.eval(slot_ctx) == evaluate(slot_ctx.values)
+            t_dict = best_time(lambda: term.eval(ctx), number=500)
+            t_slots = best_time(lambda: term.eval(slot_ctx), number=500)
+            t_bound = best_time(lambda: evaluate(slot_ctx.values), number=500)
+            print("%9d  %5d  %14.1f  %15.1f  %16.1f" % (count, count_nodes(term), t_dict * 1e6,
+                                                       t_slots * 1e6, t_bound * 1e6))
+
+
+if __name__ == "__main__":
+    main()
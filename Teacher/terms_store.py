@@ -0,0 +1,231 @@
+"""
+Compact binary storage of corpora of terms, loaded back with mmap.
+
+Pickling a corpus stores every node as a Python object with its dictionary of
+attributes. This module stores the nodes of all the terms in flat arrays instead,
+each term in postfix order (see terms_tape), one after the other:
+
+    header      magic b"TRMS", version, number of terms, nodes, constants, size of names
+    roots       int32 per term: index of the root node, the term starts after the previous root
+    opcodes     uint8 per node: the Opcode of terms_vm (CONST, VAR, NEG, ADD, ..., CALL)
+    arguments   int32 per node: index in the constant pool (CONST), in the names (VAR)
+                or index of the (left) operand
+    rights      int32 per node: index of the right operand, index in the names of
+                the function (CALL), -1 if none
+    constants   float64 pool of the distinct constants
+    names       the distinct names of the variables and functions separated by a null byte
+
+The functions are stored by name and looked up in terms_ops.FUNCTION_DICT when
+the term is evaluated, only the functions of one argument can be stored. The
+operators are stored by their opcode, thus the operators added with
+register_binary or register_unary cannot be stored (ValueError).
+
+Each section starts at a multiple of 8 bytes, the integers and floats are stored
+in the native byte order. The constants are stored as floats, thus a constant 3
+is evaluated as 3.0. A 'Corpus_file' maps the file in memory and evaluates a term
+directly from the arrays, without rebuilding the objects of the term.
+
+Measures of the launcher (20000 random terms of depth 20, 1099271 nodes):
+
+                    bytes per node   load time
+    pickle                    15.5     10.0 s
+    terms_store                9.1      0.04 ms (mmap, the pages are read on demand)
+"""
+
+import os
+import mmap
+import struct
+import pickle
+import random
+import tempfile
+from array import array
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_ops import Kind, FUNCTION_DICT
+from terms_tape import Tape
+from terms_vm import Opcode, BIN_OPCODES, UNA_OPCODES, BIN_OPERATIONS
+from terms_bench import load_flavours, random_term, count_nodes, best_time
+
+MAGIC = b"TRMS"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIII")  # magic, version, terms, nodes, constants, size of names
+
+# operation of the binary opcodes, indexed by the value of the opcode
+BIN_OPERATIONS_BY_CODE: Dict[int, Callable[[Any, Any], Any]] = {opcode.value: operation
+                                                                for opcode, operation in BIN_OPERATIONS.items()}
+
+
+def padding(size: int) -> bytes:
+    """
+    :return: the null bytes to add after a section of the given size
+    """
+    return bytes(-size % 8)
+
+
+def write_corpus(terms: List[Any], path: str) -> None:
+    """
+    Writes terms of 'terms.py' or 'terms-enum.py' into a file.
+    :param terms: the terms to store
+    :param path: name of the file
+    """
+    roots = array("i")
+    opcodes = array("B")
+    arguments = array("i")
+    rights = array("i")
+    constants = array("d")
+    constant_index: Dict[Tuple[type, str], int] = {}
+    name_index: Dict[str, int] = {}
+    for term in terms:
+        tape = Tape(term)
+        start = len(opcodes)
+        for node_kind, argument, operands in zip(tape.kinds, tape.arguments, tape.operands):
+            right = -1
+            if node_kind == Kind.CONSTANT:
+                key = (type(argument), repr(argument))  # keeps 0.0 and -0.0 apart
+                if key not in constant_index:
+                    constant_index[key] = len(constants)
+                    constants.append(argument)
+                opcode, argument = Opcode.CONST, constant_index[key]
+            elif node_kind == Kind.VARIABLE:
+                opcode, argument = Opcode.VAR, name_index.setdefault(argument, len(name_index))
+            elif node_kind == Kind.UNARY:
+                if argument not in UNA_OPCODES:
+                    raise ValueError("the unary operator '" + argument + "' has no opcode, only the built-in "
+                                     + "operators can be stored")
+                opcode, argument = UNA_OPCODES[argument], start + operands[0]
+            elif node_kind == Kind.FUNCTION:
+                if len(operands) != 1:
+                    raise ValueError("the function '" + argument + "' has " + str(len(operands))
+                                     + " arguments, only the functions of one argument can be stored")
+                opcode, right = Opcode.CALL, name_index.setdefault(argument, len(name_index))
+                argument = start + operands[0]
+            else:
+                if argument not in BIN_OPCODES:
+                    raise ValueError("the binary operator '" + argument + "' has no opcode, only the built-in "
+                                     + "operators can be stored")
+                opcode, argument, right = BIN_OPCODES[argument], start + operands[0], start + operands[1]
+            opcodes.append(opcode.value)
+            arguments.append(argument)
+            rights.append(right)
+        roots.append(len(opcodes) - 1)
+
+    names = b"\0".join(name.encode("utf-8") for name in name_index)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(roots), len(opcodes), len(constants), len(names)))
+        for section in [roots.tobytes(), opcodes.tobytes(), arguments.tobytes(), rights.tobytes(),
+                        constants.tobytes(), names]:
+            file.write(section)
+            file.write(padding(len(section)))
+
+
+class Corpus_file:
+    """
+    Corpus of terms mapped in memory. The arrays are views of the mapped file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Maps the file and reads its header, the rest is read on demand by the system.
+        :param path: name of a file written by write_corpus
+        """
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, terms, nodes, constants, names_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'" + path + "' is not a corpus of terms (version " + str(VERSION) + ")")
+        self.view = memoryview(self.map)
+        offset = HEADER.size + len(padding(HEADER.size))
+        sections = []
+        for count, code in [(terms, "i"), (nodes, "B"), (nodes, "i"), (nodes, "i"), (constants, "d")]:
+            size = count * array(code).itemsize
+            sections.append(self.view[offset:offset + size].cast(code))
+            offset += size + len(padding(size))
+        self.roots, self.opcodes, self.arguments, self.rights, self.constants = sections
+        names = bytes(self.view[offset:offset + names_size])
+        self.names = [name.decode("utf-8") for name in names.split(b"\0")] if names_size else []
+
+    def __len__(self) -> int:
+        """
+        :return: the number of terms of the corpus
+        """
+        return len(self.roots)
+
+    def close(self) -> None:
+        """
+        Releases the views and unmaps the file.
+        """
+        for view in [self.roots, self.opcodes, self.arguments, self.rights, self.constants, self.view]:
+            view.release()
+        self.map.close()
+
+    def eval(self, index: int, context: Any) -> float:
+        """
+        Evaluates a term of the corpus directly from the arrays.
+        :param index: number of the term in the corpus
+        :param context: where the bindings (variable name, value) are stored
+        :return: the value of the term
+        """
+        start = self.roots[index - 1] + 1 if index > 0 else 0
+        opcodes, arguments, rights, constants, names = self.opcodes, self.arguments, self.rights, \
+            self.constants, self.names
+        get_value = context.get_value
+        const, var, neg, call = Opcode.CONST.value, Opcode.VAR.value, Opcode.NEG.value, Opcode.CALL.value
+        values: List[Any] = []
+        for node in range(start, self.roots[index] + 1):
+            opcode = opcodes[node]
+            if opcode == const:
+                values.append(constants[arguments[node]])
+            elif opcode == var:
+                values.append(get_value(names[arguments[node]]))
+            elif opcode == neg:
+                values.append((-1) * values[arguments[node] - start])
+            elif opcode == call:
+                values.append(FUNCTION_DICT[names[rights[node]]][0](values[arguments[node] - start]))
+            else:
+                values.append(BIN_OPERATIONS_BY_CODE[opcode](values[arguments[node] - start],
+                                                             values[rights[node] - start]))
+        return values[-1]
+
+
+def main() -> None:
+    """ Launcher: size and load time of the binary format against pickle """
+    names = ["a", "b", "c", "d"]
+    module = load_flavours()[0]
+    ctx = module.Context()
+    for name in names:
+        ctx.bind(name, random.Random(name).uniform(-2, 2))
+    rng = random.Random(9)
+    corpus = [random_term(module, 20, names, rng) for _ in range(20000)]
+    nodes = sum(count_nodes(term) for term in corpus)
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, "corpus.terms")
+        pickle_path = os.path.join(directory, "corpus.pickle")
+        t_write = best_time(lambda: write_corpus(corpus, store_path), repeat=1)
+        with open(pickle_path, "wb") as file:
+            pickle.dump(corpus, file)
+
+        def load_pickle() -> List[Any]:
+            with open(pickle_path, "rb") as file:
+                return pickle.load(file)
+
+        stored = Corpus_file(store_path)
+        assert all(stored.eval(i, ctx) == term.eval(ctx) for i, term in enumerate(corpus))
+        stored.close()
+
+        def load_store() -> None:
+            Corpus_file(store_path).close()
+
+        print("%d terms, %d nodes, written in %.2f s" % (len(corpus), nodes, t_write))
+        print("pickle:      %5.1f bytes per node, load %9.2f ms" % (os.path.getsize(pickle_path) / nodes,
+                                                                    best_time(load_pickle, repeat=3) * 1e3))
+        print("terms_store: %5.1f bytes per node, load %9.2f ms" % (os.path.getsize(store_path) / nodes,
+                                                                    best_time(load_store, repeat=3) * 1e3))
+        stored = Corpus_file(store_path)
+        t_eval = best_time(lambda: [stored.eval(i, ctx) for i in range(len(stored))], repeat=1)
+        stored.close()
+        print("evaluation of all the terms from the mapped file: %.2f s" % t_eval)
+
+
+if __name__ == "__main__":
+    main()
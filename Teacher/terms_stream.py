@@ -0,0 +1,172 @@
+"""
+Streaming evaluation of a term over a file of bindings, one row per context.
+
+The file starts with a header giving the names of the columns, then each line
+holds the values of the variables of one context (CSV, or any delimiter):
+
+    a,b,d
+    1.5,2,7
+    ...
+
+Building a Context and calling bind and eval for each line is slow, and a big
+file cannot be loaded at once. 'evaluate_stream' reads the file in chunks of a
+fixed number of lines, converts each chunk into columns with NumPy and
+evaluates the term for the whole chunk with terms_batch, then writes the values
+of the chunk, one per line, before reading the next one. The memory used is
+proportional to the size of a chunk, not to the size of the file:
+
+    with open("bindings.csv") as source, open("values.txt", "w") as sink:
+        report = evaluate_stream(term, source, sink, chunk_rows=100000)
+    print(report)                         # rows, seconds and rows per second
+
+Only the columns of the variables of the term are converted. The empty lines
+are skipped, every other line is a row (there are no comment lines). The values
+are written with repr, thus they are read back exactly by float().
+"""
+
+import os
+import time
+import random
+import tempfile
+import tracemalloc
+from itertools import islice
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable, TextIO
+import numpy as np
+from terms_ops import Kind
+from terms_tape import Tape
+from terms_batch import evaluate
+from terms_bench import load_flavours, random_term, best_time
+
+
+class Stream_report:
+    """
+    Number of rows evaluated by a stream and the time spent.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return "%d rows in %d chunks, %.2f s, %.0f rows per second" % (self.rows, self.chunks, self.seconds,
+                                                                      self.rows_per_second())
+
+
+def variables_of(term: Any) -> List[str]:
+    """
+    :return: the names of the variables of a term, each one once
+    """
+    tape = Tape(term)
+    return list(dict.fromkeys(argument for node_kind, argument in zip(tape.kinds, tape.arguments)
+                              if node_kind == Kind.VARIABLE))
+
+
+def evaluate_stream(term: Any, source: TextIO, sink: TextIO, chunk_rows: int = 100000, delimiter: str = ",",
+                    progress: Optional[Callable[[Stream_report], None]] = None) -> Stream_report:
+    """
+    Evaluates a term for each line of a file of bindings and writes the values.
+    :param term: term of 'terms.py' or 'terms-enum.py'
+    :param source: the file of bindings, its first line is the header
+    :param sink: the file receiving one value per line
+    :param chunk_rows: number of lines read and evaluated at once
+    :param delimiter: separator of the values in a line
+    :param progress: if given, called with the report after each chunk
+    :return: the number of rows and the throughput
+    """
+    report = Stream_report()
+    start = time.perf_counter()
+    header = [name.strip() for name in source.readline().split(delimiter)]
+    names = variables_of(term)
+    for name in names:
+        if name not in header:
+            raise ValueError("the variable '" + name + "' is not a column of the header " + str(header))
+    usecols = [header.index(name) for name in names]
+    while True:
+        chunk = list(islice(source, chunk_rows))
+        if not chunk:
+            break
+        lines = [line for line in chunk if line.strip()]  # the empty lines are not rows
+        if not lines:
+            continue
+        rows = len(lines)
+        if names:
+            table = np.loadtxt(lines, delimiter=delimiter, usecols=usecols, dtype=np.float64, ndmin=2,
+                               comments=None)
+            columns = {name: table[:, i] for i, name in enumerate(names)}
+            rows = table.shape[0]
+        else:
+            columns = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.broadcast_to(evaluate(term, columns), (rows,))
+        sink.write("\n".join(map(repr, values.tolist())) + "\n")  # faster than numpy.savetxt
+        report.rows += rows
+        report.chunks += 1
+        report.seconds = time.perf_counter() - start
+        if progress is not None:
+            progress(report)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def write_bindings(path: str, names: List[str], rows: int, chunk_rows: int = 100000) -> None:
+    """
+    Writes a file of random bindings, with a header and the given number of rows.
+    """
+    rng = np.random.default_rng(0)
+    with open(path, "w") as file:
+        file.write(",".join(names) + "\n")
+        for start in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - start)
+            np.savetxt(file, rng.uniform(-10, 10, (count, len(names))), fmt="%.6f", delimiter=",")
+
+
+def main() -> None:
+    """ Launcher: throughput of the stream against a context per row, memory per chunk size """
+    module = load_flavours()[0]
+    names = ["a", "b", "c", "d", "e"]
+    term = random_term(module, 30, names, random.Random(4))
+    rows = 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "bindings.csv")
+        sink_path = os.path.join(directory, "values.txt")
+        write_bindings(source_path, names, rows)
+        print("%d rows, %.1f MB of bindings" % (rows, os.path.getsize(source_path) / 1e6))
+
+        def row_by_row(count: int) -> List[float]:
+            values = []
+            with open(source_path) as source:
+                header = source.readline().strip().split(",")
+                for line in islice(source, count):
+                    ctx = module.Context()
+                    for name, text in zip(header, line.split(",")):
+                        ctx.bind(name, float(text))
+                    values.append(term.eval(ctx))
+            return values
+
+        count = 50000
+        t_rows = best_time(lambda: row_by_row(count), repeat=1)
+        print("a Context per row: %.0f rows per second" % (count / t_rows))
+        for chunk_rows in [1000, 10000, 100000]:
+            with open(source_path) as source, open(sink_path, "w") as sink:
+                report = evaluate_stream(term, source, sink, chunk_rows)
+            print("chunks of %6d rows: %s" % (chunk_rows, report))
+        with open(sink_path) as sink:
+            streamed = [float(line) for line in islice(sink, count)]
+        assert np.allclose(streamed, row_by_row(count), rtol=1e-12)
+        for chunk_rows in [1000, 100000]:
+            tracemalloc.start()
+            with open(source_path) as source, open(sink_path, "w") as sink:
+                evaluate_stream(term, source, sink, chunk_rows)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("chunks of %6d rows: peak memory %.1f MB" % (chunk_rows, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Recording of a term into a tape: the list of its nodes in postfix order.
+
+The tape is a flat representation of a term used by the tools which walk the
+nodes in a loop rather than with recursive calls (differentiation, storage, ...).
+The operands of a node are before the node and are referred to by their position.
+"""
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_ops import Kind, kind, symbol
+
+
+class Tape:
+    """
+    Nodes of a term in postfix order. For each node the tape stores its kind,
+    its argument (value of a constant, name of a variable, symbol of an operator
+    or name of a function) and the positions of its operands in the tape.
+    """
+
+    def __init__(self, term: Any) -> None:
+        """
+        Records a term of 'terms.py' or 'terms-enum.py' without recursion. A node
+        shared by several parents (see terms_dag) is recorded only once.
+        :param term: the term to record
+        """
+        self.kinds: List[Kind] = []
+        self.arguments: List[Any] = []
+        self.operands: List[Tuple[int, ...]] = []
+        self.position: Dict[int, int] = {}  # identity of node -> position in the tape
+        self.record(term)
+
+    def record(self, term: Any) -> int:
+        """
+        Appends the nodes of another term, the nodes already in the tape are not
+        recorded again. The root of the term is then the last node of the tape,
+        unless the whole term was already recorded. The nodes are known by their
+        identity, thus the terms recorded before must still exist.
+        :param term: the term to record
+        :return: the position of the root of the term
+        """
+        position = self.position
+        todo: List[Tuple[Any, bool]] = [(term, False)]
+        while todo:
+            node, expanded = todo.pop()
+            if id(node) in position:
+                continue
+            node_kind = kind(node)
+            if node_kind == Kind.CONSTANT:
+                self.append(node_kind, node.value, ())
+            elif node_kind == Kind.VARIABLE:
+                self.append(node_kind, node.name, ())
+            elif node_kind == Kind.UNARY:
+                if expanded:
+                    self.append(node_kind, symbol(node.una_op), (position[id(node.term)],))
+                else:
+                    todo += [(node, True), (node.term, False)]
+            elif node_kind == Kind.FUNCTION:
+                if expanded:
+                    self.append(node_kind, symbol(node.function),
+                                tuple(position[id(operand)] for operand in node.terms))
+                else:
+                    todo += [(node, True)] + [(operand, False) for operand in reversed(node.terms)]
+            elif expanded:
+                self.append(node_kind, symbol(node.bin_op),
+                            (position[id(node.left)], position[id(node.right)]))
+            else:
+                todo += [(node, True), (node.right, False), (node.left, False)]
+            if node_kind == Kind.CONSTANT or node_kind == Kind.VARIABLE or expanded:
+                position[id(node)] = len(self.kinds) - 1
+        return position[id(term)]
+
+    def append(self, node_kind: Kind, argument: Any, operands: Tuple[int, ...]) -> None:
+        """
+        Adds a node at the end of the tape.
+        """
+        self.kinds.append(node_kind)
+        self.arguments.append(argument)
+        self.operands.append(operands)
+
+    def __len__(self) -> int:
+        """
+        :return: the number of recorded nodes
+        """
+        return len(self.kinds)
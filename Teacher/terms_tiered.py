@@ -0,0 +1,129 @@
+"""
+Tiered evaluation: the terms are interpreted until they are hot, then compiled.
+
+Compiling a term (terms_compile) costs much more than one evaluation with the
+method 'eval', thus compiling an expression evaluated once is a waste. A
+'Tiered_evaluator' counts the evaluations of each term and interprets it with
+'eval' until the count reaches a threshold. The term is then promoted: it is
+compiled, and the next evaluations call the compiled function. A term too deep
+for the compiler (RecursionError) is lowered to the stack machine of terms_vm,
+a term too deep for 'eval' is promoted at its first evaluation.
+
+    evaluator = Tiered_evaluator(threshold=100)
+    evaluator.eval(term, ctx)               # same value as term.eval(ctx)
+    evaluator.promoted                      # the promoted terms and their tier
+
+The counters are kept in a weak dictionary: they disappear with their term.
+"""
+
+import random
+import weakref
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from terms_ops import to_string
+from terms_compile import compile_term
+from terms_vm import lower
+from terms_bench import load_flavours, random_term, best_time
+
+
+class Tier_entry:
+    """
+    Number of evaluations of a term and its fast path once promoted.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.fast_path: Optional[Callable[[Any], float]] = None
+
+
+class Tiered_evaluator:
+    """
+    Evaluates terms, compiling those evaluated at least 'threshold' times.
+    """
+
+    def __init__(self, threshold: int = 100) -> None:
+        """
+        :param threshold: number of interpreted evaluations before the promotion of a term
+        """
+        self.threshold = threshold
+        self.entries: "weakref.WeakKeyDictionary[Any, Tier_entry]" = weakref.WeakKeyDictionary()
+        self.promoted: List[Tuple[str, str]] = []  # (text of the term, "compiled" or "vm")
+        self.interpreted = 0  # number of evaluations with eval
+        self.fast = 0  # number of evaluations with the fast path
+
+    def eval(self, term: Any, context: Any) -> float:
+        """
+        Evaluates a term of 'terms.py' or 'terms-enum.py', the term is promoted
+        when it reaches the threshold.
+        :param term: the term to evaluate
+        :param context: where the bindings (variable name, value) are stored
+        :return: the value of the term
+        """
+        entry = self.entries.get(term)
+        if entry is None:
+            entry = self.entries[term] = Tier_entry()
+        elif entry.fast_path is not None:
+            self.fast += 1
+            return entry.fast_path(context)
+        entry.count += 1
+        if entry.count >= self.threshold:
+            self.promote(term, entry)
+        self.interpreted += 1
+        try:
+            return term.eval(context)
+        except RecursionError:  # too deep for eval: promoted at once
+            if entry.fast_path is None:
+                self.promote(term, entry)
+            return entry.fast_path(context)
+
+    def promote(self, term: Any, entry: Tier_entry) -> None:
+        """
+        Compiles a term, or lowers it to the stack machine if it is too deep to be compiled.
+        """
+        try:
+            entry.fast_path = compile_term(term)
+            tier = "compiled"
+        except RecursionError:
+            entry.fast_path = lower(term).run
+            tier = "vm"
+        try:
+            text = to_string(term)
+        except RecursionError:
+            text = "<too deep to be printed>"
+        self.promoted.append((text if len(text) < 60 else text[:57] + "...", tier))
+
+    def report(self) -> str:
+        """
+        :return: the counters of the evaluator
+        """
+        return "%d terms seen, %d promoted, %d evaluations interpreted, %d with a fast path" % (
+            len(self.entries), len(self.promoted), self.interpreted, self.fast)
+
+
+def main() -> None:
+    """ Launcher: mixed workload of cold and hot terms """
+    module = load_flavours()[0]
+    names = ["a", "b", "c", "d"]
+    ctx = module.Context()
+    for name in names:
+        ctx.bind(name, random.Random(name).uniform(-2, 2))
+    rng = random.Random(3)
+    cold = [random_term(module, 20, names, rng) for _ in range(5000)]
+    hot = [random_term(module, 20, names, rng) for _ in range(10)]
+    workload = cold + hot * 2000
+    rng.shuffle(workload)
+    print("%d evaluations of %d terms, %d of them hot" % (len(workload), len(cold) + len(hot), len(hot)))
+    print("threshold    time (s)")
+    t_eval = best_time(lambda: [term.eval(ctx) for term in workload], repeat=1)
+    print("%9s  %10.3f" % ("never", t_eval))
+    for threshold in [1, 10, 100, 1000]:
+        evaluator = Tiered_evaluator(threshold)
+        t_tiered = best_time(lambda: [evaluator.eval(term, ctx) for term in workload], repeat=1)
+        assert all(evaluator.eval(term, ctx) == term.eval(ctx) for term in hot)
+        print("%9d  %10.3f  %s" % (threshold, t_tiered, evaluator.report()))
+    print("promoted with threshold 1000:", evaluator.promoted[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Lexer classifying all the characters of an expression at once with NumPy.
+
+'next_token' looks at the characters one by one in Python. 'tokenize' reads the
+expression as an array of bytes and finds all its tokens with array operations:
+  - the class of every byte is read in a table of 256 entries (BYTE_CLASSES);
+  - the identifiers and the numbers are the runs of letters, digits and points,
+    a run starting with a digit is a number up to its first letter;
+  - the value of a number is computed from its digits: the integer of its digits
+    divided by a power of 10, both exact, thus the division gives the same float
+    as float(text). The numbers of more than 15 digits or of several points are
+    read by the regular expression of Table_parser.
+
+The tokens are the same as those of Table_parser, they are stored in a
+compact form: an array of the kinds (value of Token), an array of the values
+(number, or index of the name of a variable) and the list of the names.
+
+    tokens = tokenize("((rate * 12.5) + 3)")
+    tokens.kinds, tokens.values, tokens.names
+    term = parse_expression("((rate * 12.5) + 3)", terms, Array_parser)
+"""
+
+import io
+import random
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+from types import ModuleType
+import numpy as np
+from terms_ops import to_string
+from terms_parsing import Token, Parser, Table_parser, NUMBER, parse_expression, random_expression, count_tokens
+from terms_incremental import write_balanced
+from terms_bench import load_flavours, best_time
+
+# classes of the bytes which are not tokens by themselves
+DIGIT, POINT, LETTER, SPACE = 16, 17, 18, 19
+# class of each byte: the value of its Token for the operators, the parenthesis and the errors
+BYTE_CLASSES = np.full(256, Token.ERR.value, dtype=np.uint8)
+for char, token in [("+", Token.ADD), ("-", Token.SUB), ("*", Token.MUL), ("/", Token.DIV),
+                    ("(", Token.PARL), (")", Token.PARR)]:
+    BYTE_CLASSES[ord(char)] = token.value
+BYTE_CLASSES[np.frombuffer(b"0123456789", dtype=np.uint8)] = DIGIT
+BYTE_CLASSES[ord(".")] = POINT
+BYTE_CLASSES[np.frombuffer(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_", dtype=np.uint8)] = LETTER
+BYTE_CLASSES[np.frombuffer(b" \t\r\n", dtype=np.uint8)] = SPACE
+# powers of 10 exactly represented by a float
+POWERS_OF_10 = 10.0 ** np.arange(23)
+MAX_DIGITS = 15  # an integer of 15 digits is exact in a float
+# the Token of each value, indexed by an array of values
+TOKEN_OBJECTS = np.array(sorted(Token, key=lambda token: token.value), dtype=object)
+
+
+class Token_array:
+    """
+    Tokens of an expression: kinds[i] is the value of the Token of the i-th token,
+    values[i] the value of a constant or the index in 'names' of a variable,
+    integers[i] is True for a constant without decimal point. The numbers read by
+    the regular expression are given exactly by 'exact': position -> value.
+    """
+
+    def __init__(self, positions: np.ndarray, kinds: np.ndarray, values: np.ndarray, integers: np.ndarray,
+                 names: List[str], exact: Dict[int, Any]) -> None:
+        self.positions = positions
+        self.kinds = kinds
+        self.values = values
+        self.integers = integers
+        self.names = names
+        self.exact = exact
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def lists(self) -> Tuple[List[Token], List[Any]]:
+        """
+        :return: tuple (list of the Token of each token, list of their values: 0 for an operator,
+                 number for a constant and name for a variable)
+        """
+        values = self.values.astype(object)
+        values[self.integers] = self.values[self.integers].astype(np.int64).astype(object)  # Python ints
+        variables = self.kinds == Token.VAR.value
+        values[variables] = np.array(self.names + [""], dtype=object)[self.values[variables].astype(np.int64)]
+        for position, value in self.exact.items():
+            values[np.searchsorted(self.positions, position)] = value
+        return TOKEN_OBJECTS[self.kinds].tolist(), values.tolist()
+
+    def tokens(self) -> List[Tuple[Token, Any]]:
+        """
+        :return: the tokens as returned by next_token: (Token, value)
+        """
+        return list(zip(*self.lists()))
+
+
+def run_starts(mask: np.ndarray) -> np.ndarray:
+    """
+    :return: True where a run of True values of the mask starts
+    """
+    starts = mask.copy()
+    starts[1:] &= ~mask[:-1]
+    return starts
+
+
+def tokenize(expr: Any) -> Token_array:
+    """
+    Finds all the tokens of an expression with array operations.
+    :param expr: the expression, str or bytes
+    :return: the tokens in their order in the expression
+    """
+    # a character above U+00FF becomes "?", an error token as the character itself
+    data = expr.encode("latin-1", errors="replace") if isinstance(expr, str) else bytes(expr)
+    codes = np.frombuffer(data, dtype=np.uint8)
+    classes = BYTE_CLASSES[codes]
+    index = np.arange(len(codes))
+    digit = classes == DIGIT
+    letter = classes == LETTER
+    # identifiers: from the first letter of a run of letters and digits to its end
+    word = digit | letter
+    run_start = np.maximum.accumulate(np.where(run_starts(word), index, 0))
+    last_letter = np.maximum.accumulate(np.where(letter, index, -1))
+    identifier = word & (last_letter >= run_start)
+    # numbers: runs of digits and points outside the identifiers
+    number = (digit | (classes == POINT)) & ~identifier
+    number_starts = np.flatnonzero(run_starts(number))
+    number_ends = np.flatnonzero(run_starts(number[::-1]))[::-1]
+    number_ends = len(codes) - number_ends
+    counted_digits = np.concatenate(([0], np.cumsum(digit & number)))
+    digits = counted_digits[number_ends] - counted_digits[number_starts]
+    points = np.add.reduceat(classes == POINT, number_starts) if len(number_starts) else np.zeros(0, int)
+    simple = (points <= 1) & (digits >= 1) & (digits <= MAX_DIGITS)
+    # integer of the digits of each number: each digit times 10 ** (number of digits after it in its number)
+    in_number = np.flatnonzero(digit & number)
+    owner = np.searchsorted(number_starts, in_number, side="right") - 1
+    weights = POWERS_OF_10[np.minimum(counted_digits[number_ends[owner]] - counted_digits[in_number + 1],
+                                      len(POWERS_OF_10) - 1)]
+    mantissas = np.zeros(len(number_starts))
+    np.add.at(mantissas, owner, (codes[in_number] - 48) * weights)
+    point_at = np.where(classes == POINT, index, len(codes))
+    first_point = np.minimum.reduceat(point_at, number_starts) if len(number_starts) else np.zeros(0, int)
+    decimals = np.where(points == 1, counted_digits[number_ends] - counted_digits[first_point], 0)
+    numbers = mantissas / POWERS_OF_10[np.minimum(decimals, len(POWERS_OF_10) - 1)]
+    # identifiers and single tokens
+    identifier_starts = np.flatnonzero(run_starts(identifier))
+    identifier_ends = len(codes) - np.flatnonzero(run_starts(identifier[::-1]))[::-1]
+    names: Dict[str, int] = {}
+    name_index = [names.setdefault(data[start:end].decode("latin-1"), len(names))
+                  for start, end in zip(identifier_starts.tolist(), identifier_ends.tolist())]
+    single = np.flatnonzero(classes <= Token.ERR.value)
+    # the other numbers are read by the regular expression of Table_parser
+    others = ([], [], [])  # type: Tuple[List[int], List[int], List[bool]]
+    exact: Dict[int, Any] = {}
+    for start, end in zip(number_starts[~simple].tolist(), number_ends[~simple].tolist()):
+        text = data[start:end].decode("latin-1")
+        position = 0
+        while position < len(text):
+            match = NUMBER.match(text, position)
+            if match is None:  # a point alone
+                others[0].append(start + position)
+                others[1].append(Token.ERR.value)
+                others[2].append(False)
+                position += 1
+                continue
+            others[0].append(start + position)
+            others[1].append(Token.CTE.value)
+            others[2].append(False)
+            exact[start + position] = float(match.group()) if "." in match.group() else int(match.group())
+            position = match.end()
+    positions = np.concatenate((single, number_starts[simple], identifier_starts, np.array(others[0], dtype=int)))
+    order = np.argsort(positions, kind="stable")
+    kinds = np.concatenate((classes[single], np.full(simple.sum(), Token.CTE.value, dtype=np.uint8),
+                            np.full(len(identifier_starts), Token.VAR.value, dtype=np.uint8),
+                            np.array(others[1], dtype=np.uint8)))
+    values = np.concatenate((np.zeros(len(single)), numbers[simple], np.array(name_index, dtype=float),
+                             np.zeros(len(others[0]))))
+    integers = np.concatenate((np.zeros(len(single), dtype=bool), (points == 0)[simple],
+                               np.zeros(len(identifier_starts), dtype=bool), np.array(others[2], dtype=bool)))
+    return Token_array(positions[order], kinds[order], values[order], integers[order], list(names), exact)
+
+
+class Array_parser(Parser):
+    """
+    Parser of the grammar of Table_parser reading the tokens found by 'tokenize'.
+    """
+
+    def __init__(self, expr: str, module: ModuleType) -> None:
+        """
+        Initialises the expression to parse, all its tokens are found at once.
+        :param: expr: the expression to parse
+        :param module: 'terms' or 'terms-enum', the classes of the built terms
+        """
+        self.kinds, self.values = tokenize(expr).lists()
+        self.count = len(self.kinds)
+        super().__init__(expr, module)
+
+    def next_token(self) -> Tuple[Token, Any]:
+        """
+        :return: the next token of the array, an error stops the tokens as with next_token
+        """
+        idx = self.idx
+        if idx == self.count:
+            return (Token.END, 0)
+        if self.kinds[idx] != Token.ERR:
+            self.idx = idx + 1
+        return (self.kinds[idx], self.values[idx])
+
+
+def main() -> None:
+    """ Launcher: tokens per second of tokenize against next_token """
+    rng = random.Random(12)
+    module = load_flavours()[0]
+    pieces = ["12x3", "1.2.3", ".", "x.5", "1.5e", " ", "\t", "%", "rate_2", "0.1", "9" * 20, "7.", "(", ")", "+",
+              "\u20ac", "\xe9"]
+    for _ in range(3000):  # the same tokens as Table_parser, up to the first error
+        expr = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        expected = []
+        parser = Table_parser(expr, module)
+        while True:
+            expected.append(parser.current)
+            if parser.current[0] == Token.END or parser.current[0] == Token.ERR:
+                break
+            parser.current = parser.next_token()
+        tokens = tokenize(expr).tokens() + [(Token.END, 0)]
+        assert tokens[:len(expected)] == expected, (expr, tokens, expected)
+    text = "".join(random_expression(8, random.Random(i)) for i in range(2000))  # long input, single digits
+    spaced = text.replace("(", "( 12.5 * rate_1 + ").replace("+", " + ").replace(")", " )")
+    print("lexer           characters  tokens per second")
+    for label, source, read in [("next_token", text, lambda source: count_tokens(Parser(source, module))),
+                                ("Table_parser", text, lambda source: count_tokens(Table_parser(source, module))),
+                                ("tokenize", text, lambda source: len(tokenize(source))),
+                                ("Table_parser", spaced, lambda source: count_tokens(Table_parser(source, module))),
+                                ("tokenize", spaced, lambda source: len(tokenize(source)))]:
+        count = read(source)
+        t_tokens = best_time(lambda: read(source), repeat=3)
+        print("%12s  %12d  %17.0f" % (label, len(source), count / t_tokens))
+    buffer = io.StringIO()
+    write_balanced(buffer, 16, random.Random(16))
+    expr = buffer.getvalue()
+    assert to_string(parse_expression(expr, module, Array_parser)) == \
+        to_string(parse_expression(expr, module, Table_parser))
+    for parser_class in [Table_parser, Array_parser]:
+        t_parse = best_time(lambda: parse_expression(expr, module, parser_class), repeat=3)
+        print("parse of %d characters with %s: %.3f s" % (len(expr), parser_class.__name__, t_parse))
+
+
+if __name__ == "__main__":
+    main()
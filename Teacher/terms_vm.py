@@ -0,0 +1,199 @@
+"""
+Stack machine evaluating terms without recursion.
+
+A term is lowered into a flat sequence of instructions in postfix order
+(Reverse Polish Notation), e.g. (3 + -d) * 5 becomes
+
+    CONST 3, VAR d, NEG, ADD, CONST 5, MUL
+
+The virtual machine executes the instructions in a single loop with an explicit
+stack of values: a constant or a variable pushes its value, an operator pops its
+operands and pushes the result. Neither the lowering nor the execution is
+recursive, thus the depth of the term is limited only by the memory and not by
+the recursion limit of Python (about 1000 nested calls of eval).
+
+The functions (sqrt, exp, ...) and the registered operators without an opcode of
+their own are executed by CALL, whose argument is the operation and its arity.
+"""
+
+import operator
+
+# to be able to specify type annotations and static type checker mypy
+from typing import List, Any, Set, Dict, Tuple, Optional, Callable
+# for enum support
+from enum import Enum, unique
+from types import ModuleType
+from terms_ops import Kind, kind, symbol, BIN_OP_DICT, UNA_OP_DICT, FUNCTION_DICT
+from terms_bench import load_flavours, operators, best_time
+
+
+@unique
+class Opcode(Enum):
+    """Enumeration of the instructions of the stack machine"""
+    CONST = 0  # push a constant
+    VAR = 1  # push the value of a variable
+    NEG = 2  # negate the top of the stack
+    ADD = 3  # replace the two values on top of the stack by the result
+    SUB = 4
+    MUL = 5
+    DIV = 6
+    POW = 7
+    MOD = 8
+    MIN = 9
+    MAX = 10
+    CALL = 11  # replace the n values on top of the stack by the result of a function
+
+
+BIN_OPCODES: Dict[str, Opcode] = {"+": Opcode.ADD, "-": Opcode.SUB, "*": Opcode.MUL, "/": Opcode.DIV,
+                                  "**": Opcode.POW, "%": Opcode.MOD, "min": Opcode.MIN, "max": Opcode.MAX}
+
+UNA_OPCODES: Dict[str, Opcode] = {"-": Opcode.NEG}
+
+# same operations as the method eval of the binary expressions
+BIN_OPERATIONS: Dict[Opcode, Callable[[Any, Any], Any]] = {Opcode.ADD: operator.add,
+                                                           Opcode.SUB: operator.sub,
+                                                           Opcode.MUL: operator.mul,
+                                                           Opcode.DIV: operator.truediv,
+                                                           Opcode.POW: operator.pow,
+                                                           Opcode.MOD: operator.mod,
+                                                           Opcode.MIN: min,
+                                                           Opcode.MAX: max
+                                                           }
+
+
+class Program:
+    """
+    Sequence of instructions of the stack machine. An instruction is a pair
+    (opcode, argument), the argument is the value of CONST, the name of VAR,
+    the operation of a binary operator or the pair (operation, arity) of CALL
+    (resolved once, during the lowering).
+    """
+
+    def __init__(self) -> None:
+        self.instructions: List[Tuple[Opcode, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def emit(self, opcode: Opcode, argument: Any = None) -> None:
+        """
+        Appends an instruction at the end of the program.
+        """
+        self.instructions.append((opcode, argument))
+
+    def run(self, context: Any) -> float:
+        """
+        Executes the program.
+        :param context: where the bindings (variable name, value) are stored
+        :return: the value left on the stack, i.e. the value of the term
+        """
+        stack: List[Any] = []
+        push = stack.append
+        pop = stack.pop
+        get_value = context.get_value
+        const, var, neg, call = Opcode.CONST, Opcode.VAR, Opcode.NEG, Opcode.CALL  # no class lookup per instruction
+        for opcode, argument in self.instructions:
+            if opcode is const:
+                push(argument)
+            elif opcode is var:
+                push(get_value(argument))
+            elif opcode is neg:
+                stack[-1] = (-1) * stack[-1]
+            elif opcode is call:
+                function, arity = argument
+                if arity == 1:
+                    stack[-1] = function(stack[-1])
+                else:
+                    start = len(stack) - arity
+                    operands = stack[start:]
+                    del stack[start:]
+                    push(function(*operands))
+            else:
+                right = pop()
+                stack[-1] = argument(stack[-1], right)
+        return stack[0]
+
+
+def lower(term: Any) -> Program:
+    """
+    Translates a term of 'terms.py' or 'terms-enum.py' into a program in postfix order.
+    The traversal uses an explicit stack: a node is pushed first as 'to expand',
+    its children are pushed above it and the node is emitted once they are done.
+    :param term: the term to lower
+    :return: the program computing the value of the term
+    """
+    program = Program()
+    todo: List[Tuple[Any, bool]] = [(term, False)]
+    while todo:
+        node, expanded = todo.pop()
+        node_kind = kind(node)
+        if node_kind == Kind.CONSTANT:
+            program.emit(Opcode.CONST, node.value)
+        elif node_kind == Kind.VARIABLE:
+            program.emit(Opcode.VAR, node.name)
+        elif expanded:
+            if node_kind == Kind.UNARY:
+                op = symbol(node.una_op)
+                if op in UNA_OPCODES:
+                    program.emit(UNA_OPCODES[op])
+                else:
+                    program.emit(Opcode.CALL, (UNA_OP_DICT[op], 1))
+            elif node_kind == Kind.FUNCTION:
+                program.emit(Opcode.CALL, FUNCTION_DICT[symbol(node.function)])
+            else:
+                op = symbol(node.bin_op)
+                if op in BIN_OPCODES:
+                    opcode = BIN_OPCODES[op]
+                    program.emit(opcode, BIN_OPERATIONS[opcode])
+                else:
+                    program.emit(Opcode.CALL, (BIN_OP_DICT[op], 2))
+        elif node_kind == Kind.UNARY:
+            todo.append((node, True))
+            todo.append((node.term, False))
+        elif node_kind == Kind.FUNCTION:
+            todo.append((node, True))
+            todo.extend((operand, False) for operand in reversed(node.terms))
+        else:
+            todo.append((node, True))
+            todo.append((node.right, False))  # the left operand is lowered first
+            todo.append((node.left, False))
+    return program
+
+
+def left_sum(module: ModuleType, depth: int) -> Any:
+    """
+    Builds the left-leaning term (((x + 1) + 2) + ...) of the given depth,
+    one negation every 10 levels.
+    """
+    bin_ops, neg = operators(module)
+    term = module.Variable("x")
+    for level in range(1, depth + 1):
+        if level % 10 == 0:
+            term = module.Unary_expression(term, neg)
+        else:
+            term = module.Binary_expression(term, module.Constant(level), bin_ops[0])
+    return term
+
+
+def main() -> None:
+    """ Launcher: benchmark of the recursive eval against the stack machine """
+    for module in load_flavours():
+        print("Module", module.__name__)
+        print("    depth   eval (ms)   lower (ms)   run (ms)")
+        ctx = module.Context()
+        ctx.bind("x", 0.5)
+        for depth in [10, 100, 900, 10000, 1000000]:
+            term = left_sum(module, depth)
+            program = lower(term)
+            t_lower = best_time(lambda: lower(term), repeat=1)
+            t_run = best_time(lambda: program.run(ctx), repeat=3)
+            try:
+                assert term.eval(ctx) == program.run(ctx)
+                t_eval = "%11.3f" % (best_time(lambda: term.eval(ctx), repeat=3) * 1e3)
+            except RecursionError:
+                t_eval = "%11s" % "recursion"
+            print("%9d %s %12.3f %10.3f" % (depth, t_eval, t_lower * 1e3, t_run * 1e3))
+
+
+if __name__ == "__main__":
+    main()